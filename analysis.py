@@ -5,6 +5,9 @@ from matplotlib import pyplot as plt
 import pandas as pd
 import seaborn as sns
 import numpy as np
+from download import load_dataframe
+from encoders import SURFACE_LABELS, add_encoded_columns, get_encoded
+from figure_cache import cached_figure, figure_cache
 
 
 def _save_show_fig(fig, fig_location, show_figure):
@@ -14,6 +17,14 @@ def _save_show_fig(fig, fig_location, show_figure):
         fig.show()
 
 
+def _is_aggregated(df: pd.DataFrame) -> bool:
+    """
+    Checks whether df holds the aggregates of DataDownloader.get_aggregates
+    instead of the accidents.
+    """
+    return 'count' in df.columns
+
+
 def _print_categorizable_cols(df: pd.DataFrame):
     """
     Prints all columns whose unique values are lower than
@@ -27,11 +38,12 @@ def _print_categorizable_cols(df: pd.DataFrame):
 # Ukol 1: nacteni dat
 def get_dataframe(filename: str, verbose: bool = False) -> pd.DataFrame:
     """
-    Loads dataframe from a file.
-    Converts certain columns to categorical.
-    Adds date column resampled to months.
+    Loads dataframe from a file, see download.load_dataframe.
+    Converts certain columns to categorical, unless they already are.
+    Adds date column resampled to months and the columns of
+    encoders.ENCODED_COLUMNS.
     """
-    df = pd.read_pickle(filename, compression='gzip')
+    df = load_dataframe(filename)
     if verbose:
         print(F"orig_size={df.memory_usage(deep=True).sum() // 1_048_576} MB")
 
@@ -42,25 +54,62 @@ def get_dataframe(filename: str, verbose: bool = False) -> pd.DataFrame:
                           'p44', 'p45a', 'p47', 'p48a', 'p49', 'p50a', 'p50b', 'p51', 'p52', 'p53',
                           'p55a', 'p57', 'p58', 'h', 'i', 'j', 'k', 'l', 'n', 'o', 'p', 'q', 'r', 's', 't', 'p5a']
     for col in categorizable_cols:
-        df[col] = df[col].astype('category')
+        if not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
 
-    df['date'] = pd.Series(df['p2a'], dtype='datetime64[M]')
+    add_date_column(df)
+    add_encoded_columns(df)
 
     if verbose:
         print(F"new_size={df.memory_usage(deep=True).sum() // 1_048_576} MB")
     return df
 
 
+def add_date_column(df: pd.DataFrame):
+    """
+    Adds date column resampled to months.
+    The dates are either strings or datetime64, see DataDownloader.get_dataframe,
+    of a categorical column only the categories are converted.
+    """
+    dates = df['p2a']
+    if isinstance(dates.dtype, pd.CategoricalDtype):
+        # Code -1 of missing dates takes the appended NaT
+        months = np.append(_get_months(dates.cat.categories), np.datetime64('NaT', 'ns'))
+        df['date'] = months[dates.cat.codes.to_numpy()]
+    else:
+        df['date'] = _get_months(dates)
+
+
+def _get_months(dates) -> np.ndarray:
+    return pd.to_datetime(dates).to_numpy().astype('datetime64[M]').astype('datetime64[ns]')
+
+
+def _select_regions(df: pd.DataFrame, regions: list) -> pd.DataFrame:
+    """
+    Selects rows of the regions. A categorical region column keeps
+    only their categories, as the figures have a panel for each category.
+    """
+    df_regions = df[df['region'].isin(regions)]
+    if isinstance(df_regions['region'].dtype, pd.CategoricalDtype):
+        df_regions = df_regions.assign(region=df_regions['region'].cat.remove_unused_categories())
+    return df_regions
+
+
 # Ukol 2: následky nehod v jednotlivých regionech
+@cached_figure(columns=['p13a', 'p13b', 'p13c', 'region', 'count'])
 def plot_conseq(df: pd.DataFrame, fig_location: str = None,
                 show_figure: bool = False):
     """
     Plots consequences of accidents for chosen regions.
+    The df can also be aggregated by region.
     """
-    d = df[['p13a', 'p13b', 'p13c', 'region']]
-
-    grouped = d.groupby('region').agg(np.sum)
-    grouped['counts'] = d['region'].value_counts()
+    if _is_aggregated(df):
+        grouped = df.groupby('region')[['p13a', 'p13b', 'p13c', 'count']].sum()
+        grouped = grouped.rename(columns={'count': 'counts'})
+    else:
+        d = df[['p13a', 'p13b', 'p13c', 'region']]
+        grouped = d.groupby('region').agg(np.sum)
+        grouped['counts'] = d['region'].value_counts()
     grouped = grouped.reset_index().sort_values(by='counts', ascending=False)
 
     fig, axes = plt.subplots(4, 1, figsize=(6, 9))
@@ -104,6 +153,7 @@ def plot_conseq(df: pd.DataFrame, fig_location: str = None,
 
 
 # Ukol3: příčina nehody a škoda
+@cached_figure(columns=['region', 'p53', 'p12'])
 def plot_damage(df: pd.DataFrame, fig_location: str = None,
                 show_figure: bool = False):
     """
@@ -113,13 +163,10 @@ def plot_damage(df: pd.DataFrame, fig_location: str = None,
     # Prepare data
     regions = ['JHC', 'HKK', 'OLK', 'PLK']
     columns = ['region', 'p53', 'p12']
-    df_regions = df[df['region'].isin(regions)][columns]
-    df_regions['p53'] = pd.cut(df_regions['p53'], [-np.inf, 500, 2000, 5000, 10000, np.inf],
-                               labels=['<50', '50 - 200', '200 - 500', '500 - 1000', '>1000'])
-    df_regions['p12'] = pd.cut(df_regions['p12'], [99, 199, 299, 399, 499, 599, 699],
-                               labels=['Nezaviněná řidičem', 'Nepřiměřená rychlost jízdy',
-                                       'Nesprávné předjíždění', 'Nedání přednosti v jízdě', 'Nesprávný způsob jízdy',
-                                       'Technická závada vozidla'])
+    df_regions = _select_regions(df, regions)
+    df_regions = pd.DataFrame({'region': df_regions['region'],
+                               'p53': get_encoded(df_regions, 'damage'),
+                               'p12': get_encoded(df_regions, 'cause')})
     df_regions = df_regions.groupby(columns, as_index=False).agg('size')
 
     # Plot
@@ -142,34 +189,32 @@ def plot_damage(df: pd.DataFrame, fig_location: str = None,
 
 
 # Ukol 4: povrch vozovky
+@cached_figure(columns=['region', 'date', 'month', 'p16', 'p1', 'count'])
 def plot_surface(df: pd.DataFrame, fig_location: str = None,
                  show_figure: bool = False):
     """
     Plots how often each of the surfaces were present
     when accidents happened.
+    The df can also be aggregated by region, month and p16.
     """
-    # Define selected regions, columns, and labels
+    # Define selected regions and columns
     regions = ['JHC', 'HKK', 'OLK', 'PLK']
     columns = ['region', 'date', 'p16', 'p1']
-    labels = ['jiný stav',
-              'suchý neznečištěný',
-              'suchý znečištěný',
-              'mokrý',
-              'bláto',
-              'náledí, ujetý sníh - posypané',
-              'náledí, ujetý sníh - neposypané',
-              'rozlitý olej, nafta apod.',
-              'souvislý sníh',
-              'náhlá změna stavu']
 
     # Prepare data
-    rename_map = {key: label for key, label in zip(range(0, len(labels)), labels)}
-    df_regions = df[df['region'].isin(regions)][columns]
-    df_regions = pd.crosstab([df_regions['region'], df_regions['date']], df_regions['p16'])
+    rename_map = SURFACE_LABELS
+    if _is_aggregated(df):
+        df_regions = _select_regions(df, regions)
+        df_regions = df_regions.pivot_table(index=['region', 'month'], columns='p16',
+                                            values='count', aggfunc='sum', fill_value=0)
+        df_regions.index = df_regions.index.rename(['region', 'date'])
+    else:
+        df_regions = _select_regions(df, regions)[columns]
+        df_regions = pd.crosstab([df_regions['region'], df_regions['date']], df_regions['p16'])
     df_regions.rename(columns=rename_map, inplace=True)
     df_regions = df_regions.stack().reset_index()
     df_grouped = df_regions.groupby(
-        ['region', 'p16', pd.Grouper(key='date', freq='M')]).sum()
+        ['region', 'p16', pd.Grouper(key='date', freq=pd.offsets.MonthEnd())]).sum()
     df_grouped = df_grouped.reset_index()
 
     # Plot
@@ -191,7 +236,8 @@ def plot_surface(df: pd.DataFrame, fig_location: str = None,
 
 
 if __name__ == "__main__":
-    accidents_df = get_dataframe("accidents.pkl.gz", verbose=True)
+    accidents_df = get_dataframe("accidents", verbose=True)
     plot_conseq(accidents_df, fig_location="01_nasledky.png", show_figure=True)
     plot_damage(accidents_df, "02_priciny.png", True)
     plot_surface(accidents_df, "03_stav.png", True)
+    print(F"Figure cache: {figure_cache.hits} hits, {figure_cache.misses} misses")
@@ -0,0 +1,523 @@
+"""
+
+@author: Ladislav Ondris
+         xondri07@vutbr.cz
+
+Measures the performance of DataDownloader on the zips
+already present in the data folder.
+Nothing is downloaded from the web, so run download.py first,
+the download benchmark serves the zips from a local HTTP server.
+"""
+
+import argparse
+import functools
+import os
+import resource
+import tempfile
+import threading
+import time
+import tracemalloc
+import zipfile
+import numpy as np
+import pandas as pd
+import requests
+from concurrent.futures import ProcessPoolExecutor
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import get_context
+import encoders
+import get_stat
+from download import DataDownloader, DATAFRAME_EXTENSIONS, load_dataframe, save_dataframe
+
+
+def bench_parser(folder):
+    """
+    Parses every region from every yearly zip with each parse engine
+    and prints the number of parsed rows per second.
+    Checks that all engines produce the same features.
+    """
+    downloader = DataDownloader(folder=folder)
+    file_paths = _get_file_paths(downloader)
+
+    results = {}
+    for parser in downloader.parsers:
+        downloader.parser = parser
+        start = time.perf_counter()
+        results[parser] = [
+            downloader._parse_region_data_from_file(file_path, file_name)
+            for file_path in file_paths
+            for file_name in _get_region_file_names(downloader)]
+        elapsed = time.perf_counter() - start
+
+        rows = sum(features[0].shape[0] for features in results[parser])
+        print(F"{parser:>8}: {rows} rows in {elapsed:.2f} s, {rows / elapsed:,.0f} rows/s")
+
+    reference, *others = results.values()
+    for other in others:
+        for features1, features2 in zip(reference, other):
+            _assert_features_equal(features1, features2)
+
+
+def bench_zlib(folder):
+    """
+    Measures the time spent decompressing the region files of all
+    yearly zips. Previously, each file was decompressed twice: once to
+    count its lines and once to parse it. Now it is decompressed once.
+    """
+    downloader = DataDownloader(folder=folder)
+    file_paths = _get_file_paths(downloader)
+
+    two_pass, single_pass = 0, 0
+    for file_path in file_paths:
+        with zipfile.ZipFile(file_path, 'r') as archive:
+            for file_name in _get_region_file_names(downloader):
+                start = time.perf_counter()
+                with archive.open(file_name, "r") as file:
+                    for _ in file:
+                        pass
+                counted = time.perf_counter()
+                archive.read(file_name)
+                end = time.perf_counter()
+
+                two_pass += end - start
+                single_pass += end - counted
+
+    print(F"  before: {two_pass:.2f} s (count lines, then parse)")
+    print(F"   after: {single_pass:.2f} s (single pass)")
+
+
+def bench_get_list(folder, regions=None):
+    """
+    Measures time and peak memory of get_list on a cold cache
+    (parsing the zips) and on a warm one (reading the cache files).
+    Uses its own cache files, which are removed afterwards.
+    """
+    downloader = _create_offline_downloader(folder)
+    try:
+        _measure("cold", lambda: downloader.get_list(regions),
+                 reset=downloader._clear_cache)
+        _measure("warm", lambda: downloader.get_list(regions),
+                 reset=downloader.region_cache.clear)
+    finally:
+        downloader._clear_cache()
+
+
+def bench_workers(folder, max_workers=None):
+    """
+    Measures the wall time of get_list of all regions on a cold cache
+    for an increasing number of worker processes.
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count()
+    downloader = _create_offline_downloader(folder)
+
+    workers_counts = [1]
+    while workers_counts[-1] < max_workers:
+        workers_counts.append(min(workers_counts[-1] * 2, max_workers))
+
+    try:
+        baseline = None
+        for workers in workers_counts:
+            downloader._clear_cache()
+            start = time.perf_counter()
+            downloader.get_list(workers=workers)
+            elapsed = time.perf_counter() - start
+
+            if baseline is None:
+                baseline = elapsed
+            print(F"{workers:>3} workers: {elapsed:.2f} s, speed-up {baseline / elapsed:.2f}x")
+    finally:
+        downloader._clear_cache()
+
+
+def bench_cache(folder, regions=None):
+    """
+    Compares the cache formats. For each format, the cache files are
+    created first, then get_list reads them in a fresh process,
+    which reports its latency and the growth of its peak RSS.
+    """
+    for cache_filename in ["benchmark_{}.pkl.gz", "benchmark_{}.npy"]:
+        downloader = _create_offline_downloader(folder, cache_filename=cache_filename)
+        try:
+            downloader._clear_cache()
+            downloader.get_list(regions)
+            # A spawned process does not share the memory of this one
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+                elapsed, rss = executor.submit(
+                    _measure_warm_get_list, folder, cache_filename, regions).result()
+        finally:
+            downloader._clear_cache()
+        print(F"{cache_filename:>20}: warm get_list {elapsed:.3f} s, "
+              F"peak RSS +{rss / 2**10:.1f} MB")
+
+
+def _measure_warm_get_list(folder, cache_filename, regions):
+    downloader = _create_offline_downloader(folder, cache_filename=cache_filename)
+    rss_before = _get_peak_rss()
+    start = time.perf_counter()
+    downloader.get_list(regions)
+    elapsed = time.perf_counter() - start
+    rss_after = _get_peak_rss()
+    return elapsed, rss_after - rss_before
+
+
+def _get_peak_rss():
+    """
+    Returns the peak RSS of this process in kB. Prefers VmHWM on Linux,
+    because ru_maxrss is inherited from the parent process.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def bench_memory(folder, regions=None):
+    """
+    Prints the memory taken by a single row of parsed data,
+    both in total and for the string columns, without and with compact.
+    """
+    for compact in [False, True]:
+        downloader = DataDownloader(folder=folder, compact=compact)
+        _get_file_paths(downloader)
+        column_indices = downloader._get_column_indices(None)
+        regions_features = downloader._parse_regions_data(
+            regions or downloader.regions, column_indices)
+        features = downloader._merge_features(list(regions_features.values()))
+
+        rows = features[0].shape[0]
+        total = sum(column.nbytes for column in features)
+        strings = sum(column.nbytes for (header_name, _), column
+                      in zip(downloader.headers, features)
+                      if header_name in downloader.compact_types)
+        categories = sum(len(value) * 4 for codes in downloader.categories.values()
+                         for value in codes)
+        print(F"compact={compact!s:>5}: {total / rows:.0f} B/row, "
+              F"string columns {strings / rows:.0f} B/row, "
+              F"categories {categories / 2**10:.1f} kB")
+
+
+def bench_download(folder, max_workers=None):
+    """
+    Serves the zips of the folder from a local HTTP server and measures
+    downloading them into a temporary folder, first with a sequential
+    download in 128-byte chunks as before, then with an increasing
+    number of concurrent transfers.
+    """
+    if max_workers is None:
+        max_workers = 4
+    handler = functools.partial(_QuietRequestHandler, directory=folder)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = F"http://127.0.0.1:{server.server_port}/"
+
+    try:
+        for workers in [None, *range(1, max_workers + 1)]:
+            with tempfile.TemporaryDirectory() as download_folder:
+                downloader = DataDownloader(url=url, folder=download_folder,
+                                            download_workers=workers or 1)
+                if workers is None:
+                    # A fresh connection and small chunks for each file, as before
+                    downloader.session = _FreshRequests()
+                    downloader.chunk_size = 128
+                start = time.perf_counter()
+                count = downloader._download_files_if_not_exist()
+                elapsed = time.perf_counter() - start
+
+            name = "before" if workers is None else F"{workers} workers"
+            print(F"{name:>10}: {count} files in {elapsed:.2f} s")
+    finally:
+        server.shutdown()
+
+
+class _QuietRequestHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class _FreshRequests:
+    def get(self, *args, **kwargs):
+        return requests.get(*args, **kwargs)
+
+
+def bench_chunks(folder, chunk_rows=10000):
+    """
+    Compares peak memory of counting accidents in each year and region
+    over all regions with get_list and with iter_chunks, both reading
+    the cache files.
+    """
+    downloader = _create_offline_downloader(folder)
+    columns = ["region", "p2a"]
+    try:
+        downloader.get_list(columns=columns)
+        for name, data_source in [
+                ("get_list", lambda: [downloader.get_list(columns=columns)]),
+                ("iter_chunks", lambda: downloader.iter_chunks(columns=columns,
+                                                               chunk_rows=chunk_rows))]:
+            downloader.region_cache.clear()
+            tracemalloc.start()
+            start = time.perf_counter()
+            get_stat._get_counts_for_each_year_and_region_in_chunks(data_source())
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(F"{name:>12}: {elapsed:.2f} s, peak memory {peak / 2**20:.1f} MB")
+    finally:
+        downloader._clear_cache()
+
+
+def bench_aggregates(folder):
+    """
+    Compares counting accidents in each year and region by reading
+    the rows with get_list, warm, with reading the saved aggregates.
+    """
+    downloader = _create_offline_downloader(folder)
+    columns = ["region", "p2a"]
+    try:
+        downloader.get_list()
+        for name, count in [
+                ("get_list", lambda: get_stat._get_counts_for_each_year_and_region_in_chunks(
+                    [downloader.get_list(columns=columns)])),
+                ("aggregates", lambda: get_stat._get_counts_for_each_year_and_region_from_aggregates(
+                    downloader.get_aggregates(by=["region", "year"])))]:
+            downloader.region_cache.clear()
+            start = time.perf_counter()
+            count()
+            elapsed = time.perf_counter() - start
+            print(F"{name:>12}: {elapsed:.3f} s")
+    finally:
+        downloader._clear_cache()
+
+
+def bench_counts(rows=5_000_000):
+    """
+    Compares counting accidents in each year and region of random rows
+    with the former loop over years with the single pass of get_stat.
+    """
+    regions = np.array(["PHA", "STC", "JHC", "PLK", "ULK", "HKK", "JHM",
+                        "MSK", "OLK", "ZLK", "VYS", "PAK", "LBK", "KVK"])
+    rng = np.random.default_rng(0)
+    regions_col = regions[rng.integers(0, len(regions), rows)]
+    dates_col = np.datetime64("2016-01-01") + rng.integers(0, 4 * 365, rows)
+    years_col = dates_col.astype("datetime64[Y]")
+
+    start = time.perf_counter()
+    unique_years, year_indices = np.unique(years_col, return_inverse=True)
+    expected = _get_counts_with_loop(regions_col, unique_years, year_indices)
+    loop_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    year_labels, region_labels, counts = get_stat._get_counts_for_each_year_and_region(
+        regions_col, years_col)
+    elapsed = time.perf_counter() - start
+
+    for i, (year, regions_counts) in enumerate(expected):
+        if str(year) != year_labels[i] or \
+                not np.array_equal(regions_counts[:, 1].astype(int), counts[i]):
+            raise AssertionError("Counts differ.")
+    print(F"    loop: {rows} rows in {loop_elapsed:.2f} s")
+    print(F"bincount: {rows} rows in {elapsed:.2f} s, speed-up {loop_elapsed / elapsed:.1f}x")
+
+
+def _get_counts_with_loop(regions_col, unique_years, year_indices):
+    counts = []
+    for i, year in enumerate(unique_years):
+        regions_for_the_year = regions_col[np.argwhere(year_indices == i)]
+        region_labels, region_counts = np.unique(regions_for_the_year, return_counts=True)
+        regions_counts = np.stack([region_labels, region_counts], axis=1)
+        counts.append([year, regions_counts])
+    return counts
+
+
+def bench_density(rows=1_000_000):
+    """
+    Compares rendering random accident positions as points
+    with rendering their density, both time and size of the saved figure.
+    """
+    # Imported here, so that the other benchmarks do not need the geo dependencies
+    import matplotlib.pyplot as plt
+    import geo
+
+    rng = np.random.default_rng(0)
+    centers = rng.uniform([-580000, -1160000], [-500000, -1060000], size=(50, 2))
+    positions = centers[rng.integers(0, len(centers), rows)] + rng.normal(0, 3000, size=(rows, 2))
+    x, y = positions[:, 0], positions[:, 1]
+
+    with tempfile.TemporaryDirectory() as folder:
+        for mode in geo.PLOT_MODES:
+            for extension in ["png", "pdf"]:
+                file_path = os.path.join(folder, F"{mode}.{extension}")
+                start = time.perf_counter()
+                fig, ax = plt.subplots(1, 1, figsize=(10, 16))
+                geo._plot_accidents(ax, x, y, '#2b2f35', mode)
+                fig.savefig(file_path)
+                plt.close(fig)
+                elapsed = time.perf_counter() - start
+                print(F"{mode:>6} {extension}: {rows} points in {elapsed:.2f} s, "
+                      F"{os.path.getsize(file_path) / 1_048_576:.2f} MB")
+
+
+def bench_binning(rows=5_000_000):
+    """
+    Compares binning random cause and damage codes with pd.cut
+    with the lookup tables of encoders.
+    """
+    rng = np.random.default_rng(0)
+    columns = {'p12': (pd.Series(rng.integers(100, 700, rows)), [99, 199, 299, 399, 499, 599, 699],
+                       encoders.CAUSES),
+               'p53': (pd.Series(rng.integers(0, 20000, rows)), [-np.inf, 500, 2000, 5000, 10000, np.inf],
+                       encoders.DAMAGES)}
+    for name, (col, bins, encoder) in columns.items():
+        start = time.perf_counter()
+        expected = pd.cut(col, bins, labels=encoder.labels)
+        cut_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        encoded = encoder.encode(col)
+        elapsed = time.perf_counter() - start
+
+        if not expected.equals(encoded):
+            raise AssertionError("Binned columns differ.")
+        print(F"{name}: pd.cut {cut_elapsed:.3f} s, lookup table {elapsed:.3f} s, "
+              F"speed-up {cut_elapsed / elapsed:.1f}x")
+
+
+def bench_dataframe(folder):
+    """
+    Compares loading the dataframe of all regions from a gzipped pickle,
+    converting the columns to categorical one by one afterwards as
+    analysis.py does, with loading the categorical dataframe
+    of DataDownloader.get_dataframe from each columnar format.
+    """
+    downloader = _create_offline_downloader(folder)
+    try:
+        headers, features = downloader.get_list()
+        plain_df = pd.DataFrame(dict(zip(headers, features)))
+        df = downloader.get_dataframe()
+    finally:
+        downloader._clear_cache()
+
+    with tempfile.TemporaryDirectory() as dataframe_folder:
+        file_path = os.path.join(dataframe_folder, "accidents.pkl.gz")
+        save_dataframe(plain_df, file_path)
+        start = time.perf_counter()
+        loaded = load_dataframe(file_path)
+        for header_name in downloader.categorical_headers:
+            loaded[header_name] = loaded[header_name].astype('category')
+        elapsed = time.perf_counter() - start
+        _print_dataframe_load("before", file_path, elapsed)
+
+        for extension in DATAFRAME_EXTENSIONS:
+            file_path = os.path.join(dataframe_folder, "accidents" + extension)
+            try:
+                save_dataframe(df, file_path)
+            except ImportError as error:
+                print(F"{extension:>10}: skipped, {error}")
+                continue
+            start = time.perf_counter()
+            load_dataframe(file_path)
+            elapsed = time.perf_counter() - start
+            _print_dataframe_load(extension, file_path, elapsed)
+
+
+def _print_dataframe_load(name, file_path, elapsed):
+    size = os.path.getsize(file_path)
+    print(F"{name:>10}: loaded in {elapsed:.3f} s, file {size / 2**20:.1f} MB")
+
+
+def _create_offline_downloader(folder, cache_filename="benchmark_{}.pkl.gz", **kwargs):
+    # Never touch the network, only the local zips are measured
+    downloader = DataDownloader(folder=folder, cache_filename=cache_filename,
+                                offline=True, **kwargs)
+    _get_file_paths(downloader)
+    return downloader
+
+
+def _measure(name, function, reset):
+    """
+    Runs the function twice, first to measure time and then
+    to measure peak memory, as tracing slows it down considerably.
+    """
+    reset()
+    start = time.perf_counter()
+    _, features = function()
+    elapsed = time.perf_counter() - start
+
+    reset()
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    rows = features[0].shape[0]
+    result_size = sum(column.nbytes for column in features)
+    print(F"{name:>8}: {rows} rows in {elapsed:.2f} s, "
+          F"peak memory {peak / 2**20:.1f} MB, result {result_size / 2**20:.1f} MB")
+
+
+def _get_file_paths(downloader):
+    file_paths = downloader._get_data_file_paths()
+    file_paths = downloader._get_latest_paths_for_each_year(file_paths)
+    if len(file_paths) == 0:
+        raise ValueError(F"No zip files found in {downloader.folder}.")
+    return file_paths
+
+
+def _get_region_file_names(downloader):
+    return [downloader._convert_region_to_filename(region)
+            for region in downloader.regions]
+
+
+def _assert_features_equal(features1, features2):
+    for column1, column2 in zip(features1, features2):
+        equal_nan = column1.dtype.kind in "fmM"
+        if column1.dtype != column2.dtype or \
+                not np.array_equal(column1, column2, equal_nan=equal_nan):
+            raise AssertionError("Parsers produced different features.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('benchmark', choices=['parser', 'zlib', 'get_list', 'workers', 'cache', 'memory',
+                                                     'download', 'chunks', 'dataframe',
+                                                     'aggregates', 'counts', 'density', 'binning'],
+                        help='The benchmark to run')
+    parser.add_argument('--folder', type=str, default='data',
+                        help='Folder with the downloaded zips')
+    parser.add_argument('--rows', type=int, default=5_000_000,
+                        help='Number of random rows for the counts, density and binning benchmarks')
+    parser.add_argument('--max_workers', type=int,
+                        help='Maximum number of worker processes or threads, '
+                             'all CPUs by default, 4 threads for download')
+    args = parser.parse_args()
+
+    if args.benchmark == 'parser':
+        bench_parser(args.folder)
+    elif args.benchmark == 'zlib':
+        bench_zlib(args.folder)
+    elif args.benchmark == 'get_list':
+        bench_get_list(args.folder)
+    elif args.benchmark == 'workers':
+        bench_workers(args.folder, args.max_workers)
+    elif args.benchmark == 'cache':
+        bench_cache(args.folder)
+        bench_cache(args.folder, ["OLK"])
+    elif args.benchmark == 'memory':
+        bench_memory(args.folder)
+    elif args.benchmark == 'download':
+        bench_download(args.folder, args.max_workers)
+    elif args.benchmark == 'chunks':
+        bench_chunks(args.folder)
+    elif args.benchmark == 'dataframe':
+        bench_dataframe(args.folder)
+    elif args.benchmark == 'aggregates':
+        bench_aggregates(args.folder)
+    elif args.benchmark == 'counts':
+        bench_counts(args.rows)
+    elif args.benchmark == 'density':
+        bench_density(args.rows)
+    elif args.benchmark == 'binning':
+        bench_binning(args.rows)
@@ -1,7 +1,9 @@
 from matplotlib import pyplot as plt
 import pandas as pd
 import seaborn as sns
-from datetime import datetime
+from download import load_dataframe
+from encoders import CONCRETE_CAUSES, ROAD_TYPE_LABELS, add_encoded_columns, get_encoded
+from figure_cache import cached_figure, figure_cache
 
 
 def _save_show_fig(fig, fig_location, show_figure):
@@ -27,6 +29,7 @@ def plot_time(df: pd.DataFrame):
     g.fig.show()
 
 
+@cached_figure(columns=['p1', 'p2a', 'p2b', 'p36'])
 def plot_time_roadtype(df: pd.DataFrame, fig_location: str = None,
                        show_figure: bool = False):
     """
@@ -53,22 +56,18 @@ def plot_time_roadtype(df: pd.DataFrame, fig_location: str = None,
     fig.tight_layout()
     fig.subplots_adjust(right=0.6)
     ax.get_legend().remove()
-    labels = ['dálnice', 'silnice 1. třídy', 'silnice 2. třídy', 'silnice 3. třídy',
-              'křižovatky ve městech', 'komunikace sledovaná', 'komunikace místní',
-              'účelová - polní a lesní cesty apod.', 'účelová - parkoviště, odpočívky apod.']
+    labels = list(ROAD_TYPE_LABELS.values())
     ax.legend(labels, loc='center left', bbox_to_anchor=(0.98, 0.5), title='Typ vozovky', frameon=False)
     _save_show_fig(fig, fig_location, show_figure)
 
 
 def _get_causes_df(df: pd.DataFrame):
     df_cause = df.loc[:, ['p1', 'p36', 'p12']]
-    df_cause['cause'] = pd.cut(df_cause['p12'], [99, 199, 299, 399, 499, 599, 699],
-                               labels=['Nezaviněná řidičem', 'Nepřiměřená rychlost jízdy',
-                                       'Nesprávné předjíždění', 'Nedání přednosti v jízdě', 'Nesprávný způsob jízdy',
-                                       'Technická závada vozidla'])
+    df_cause['cause'] = get_encoded(df, 'cause')
     return df_cause
 
 
+@cached_figure(columns=['p1', 'p36', 'p12'])
 def plot_main_causes(df: pd.DataFrame, fig_location: str = None,
                      show_figure: bool = False):
     df_cause = _get_causes_df(df)
@@ -101,19 +100,9 @@ def table_main_concrete_causes(df: pd.DataFrame):
     df_cause_grouped = df_cause.groupby(['p12', 'cause'], as_index=False).agg('size')
     df_cause_grouped['percentage'] = df_cause_grouped['size'] / len(df_cause.index) * 100
     df_concrete_causes = df_cause_grouped[df_cause_grouped['percentage'] > 5]
-    concrete_causes_labels = {100: "",
-                              204: "nepřizpůsobení rychlosti stavu vozovky",
-                              401: "semaforu",
-                              403: "proti příkazu dopravní značky",
-                              405: "při odbočování vlevo",
-                              411: "přejíždění do jiného pruhu",
-                              502: "vyhýbání bez dostatečného bočního odstupu",
-                              503: "nedodržení bezpečné vzdálenosti za vozidlem",
-                              504: "nesprávné otáčení nebo couvání",
-                              508: "řidič se plně nevěnoval řízení vozidla",
-                              511: "nezvládnutí řízení vozidla",
-                              516: "jiný druh nesprávného způsobu jízdy"}
-    df_concrete_causes['p12'] = df_concrete_causes['p12'].replace(concrete_causes_labels)
+    # Codes without a label are kept
+    concrete_causes = CONCRETE_CAUSES.encode(df_concrete_causes['p12']).astype(object)
+    df_concrete_causes['p12'] = concrete_causes.where(concrete_causes.notna(), df_concrete_causes['p12'])
     df_table = pd.pivot_table(data=df_concrete_causes, index=['cause', 'p12'], values='percentage')
     df_table = df_table.rename(index={'cause': 'Příčina nehody', 'p12': "Upřesnění"},
                                columns={'percentage': '%'})
@@ -132,10 +121,9 @@ def count_accidents_during_night(df: pd.DataFrame):
 
 
 def get_number_of_days(df: pd.DataFrame):
-    first_day = df['p2a'].min()
-    last_day = df['p2a'].max()
-    interval = datetime.fromisoformat(last_day) - datetime.fromisoformat(first_day)
-    return interval.days
+    """ The dates are either strings or datetime64, see DataDownloader.get_dataframe. """
+    dates = pd.to_datetime(df['p2a'])
+    return (dates.max() - dates.min()).days
 
 
 def compute_daily_accidents(df: pd.DataFrame):
@@ -145,9 +133,11 @@ def compute_daily_accidents(df: pd.DataFrame):
 
 
 if __name__ == "__main__":
-    df = pd.read_pickle("accidents.pkl.gz")
+    df = load_dataframe("accidents")
+    add_encoded_columns(df)
     plot_time_roadtype(df, "04_typ_komunikace.png", True)
     plot_main_causes(df, "05_priciny.png", True)
+    print(F"Figure cache: {figure_cache.hits} hits, {figure_cache.misses} misses")
     day_accidents = count_accidents_during_day(df)
     night_accidents = count_accidents_during_night(df)
     daily_accidents = compute_daily_accidents(df)
@@ -9,6 +9,7 @@ or from local cache.
 """
 
 import numpy as np
+import pandas as pd
 import requests
 import urllib
 import re
@@ -16,16 +17,126 @@ import os
 import io
 import glob
 import gzip
+import hashlib
+import json
 import pickle
 import csv
+import time
 import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
 from bs4 import BeautifulSoup
+from collections import OrderedDict
 from pathlib import Path
 
 
+class RegionCache:
+    """
+    An in-memory cache of parsed regions with a budget of bytes.
+    When the budget is exceeded, the least recently used regions are evicted.
+    A single instance can be shared by several DataDownloaders,
+    their entries are keyed by a namespace and a region.
+    Results assembled from several regions are kept within the same budget.
+    """
+
+    def __init__(self, max_bytes=2**30):
+        if max_bytes is not None and max_bytes < 0:
+            raise ValueError("Invalid max_bytes parameter: It must not be negative.")
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        # The manifest each namespace was last validated against
+        self.manifests = {}
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, namespace, region):
+        key = (namespace, region)
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def peek(self, namespace, region):
+        """
+        Returns the features without counting a hit or a miss
+        and without marking them as recently used.
+        """
+        return self.entries.get((namespace, region))
+
+    def get_result(self, namespace, result_key):
+        return self.get(namespace, result_key)
+
+    def put_result(self, namespace, result_key, features):
+        """
+        Stores features assembled from regions, result_key is a tuple
+        of the regions and any other parameters of the result.
+        The result is removed when any of its regions is stored again.
+        """
+        self.put(namespace, result_key, features)
+
+    def put(self, namespace, region, features):
+        """
+        Stores the features and evicts the least recently used entries
+        over the budget. The stored entry itself is never evicted,
+        even if it exceeds the budget alone.
+        """
+        key = (namespace, region)
+        self._remove(key)
+        if isinstance(region, str):
+            for result in [key for key in self.entries if key[0] == namespace
+                           and isinstance(key[1], tuple) and region in key[1][0]]:
+                self._remove(result)
+        self.entries[key] = features
+        self.nbytes += self._get_nbytes(features)
+
+        while self.max_bytes is not None and self.nbytes > self.max_bytes \
+                and len(self.entries) > 1:
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def clear(self, namespace=None):
+        """
+        Removes entries of the namespace, or all entries if it is None.
+        """
+        for key in list(self.entries):
+            if namespace is None or key[0] == namespace:
+                self._remove(key)
+        if namespace is None:
+            self.manifests.clear()
+        else:
+            self.manifests.pop(namespace, None)
+
+    def validate(self, namespace, manifest):
+        """
+        Clears the namespace if its entries were cached from zip files
+        of another manifest, e.g. after another downloader on the same
+        folder parsed a changed zip file.
+        """
+        if self.manifests.get(namespace) != manifest:
+            self.clear(namespace)
+            self.manifests[namespace] = manifest
+
+    def _remove(self, key):
+        if key in self.entries:
+            self.nbytes -= self._get_nbytes(self.entries.pop(key))
+
+    def _get_nbytes(self, features):
+        return sum(column.nbytes for column in features if column is not None)
+
+    def __len__(self):
+        return len(self.entries)
+
+
 class DataDownloader:
     def __init__(self, url="https://ehw.fit.vutbr.cz/izv/",
-                 folder="data", cache_filename="data_{}.pkl.gz"):
+                 folder="data", cache_filename="data_{}.pkl.gz", parser="bulk",
+                 compact=False, download_workers=4, chunk_size=2**20,
+                 index_ttl=3600, offline=False, region_cache=None,
+                 cube_attributes=("p16",)):
 
         if url == "":
             raise ValueError("Url cannot be empty.")
@@ -37,11 +148,27 @@ class DataDownloader:
                 "It must contain a single pair of formatting braces {} " +
                 "and no slashes.")
 
-        # Cache_filename supports only .pkl.gz
-        if not cache_filename.endswith(".pkl.gz"):
+        # The cache format is selected by the extension of cache_filename
+        self.cache_backends = {
+            ".pkl.gz": (self._load_pickle_cache, self._save_pickle_cache),
+            ".npy": (self._load_columnar_cache, self._save_columnar_cache)}
+        if not cache_filename.endswith(tuple(self.cache_backends)):
             raise ValueError(
                 "Invalid cache_filename parameter: " +
-                "The only supported file type is .pkl.gz - pickle and gzip.")
+                "The supported file types are .pkl.gz - pickle and gzip, " +
+                "and .npy - a memory-mappable NumPy file for each column.")
+
+        # Parse engines producing identical features, "rows" is the reference
+        self.parsers = {"rows": self._parse_rows, "bulk": self._parse_bulk}
+        if parser not in self.parsers:
+            raise ValueError(
+                "Invalid parser parameter: " +
+                F"Supported parsers are {', '.join(self.parsers)}.")
+
+        if download_workers < 1 or chunk_size < 1:
+            raise ValueError(
+                "Invalid download_workers or chunk_size parameter: " +
+                "Both must be positive.")
 
         if not os.path.exists(folder):
             os.makedirs(folder)
@@ -49,6 +176,7 @@ class DataDownloader:
         self.url = url
         self.folder = folder
         self.cache_filename = cache_filename
+        self.parser = parser
         self.regions = ["PHA", "STC", "JHC", "PLK", "ULK", "HKK", "JHM",
                         "MSK", "OLK", "ZLK", "VYS", "PAK", "LBK", "KVK", ]
         self.headers = np.array([
@@ -119,21 +247,103 @@ class DataDownloader:
             ("t", "U32"),
             ("p5a", "i1"),
             ("region", "U3")])  # Kraj
-        self.region_cache = {}
+
+        # Parsed regions are kept in memory within a budget, see RegionCache.
+        # Pass the same RegionCache to share the regions among downloaders.
+        if region_cache is None:
+            region_cache = RegionCache()
+        self.region_cache = region_cache
+
+        # Counts and sums of casualties of each partition are aggregated
+        # by month and these low-cardinality columns, see get_aggregates
+        self.cube_attributes = list(cube_attributes)
+        self.cube_values = ["p13a", "p13b", "p13c"]
+        self._get_column_indices(self.cube_attributes)
+
+        # With compact, the string columns are stored as small integers:
+        # p2b as minutes since midnight and the others as codes
+        # of categories in self.categories, e.g. "PHA" -> 0 for region
+        self.compact = compact
+        self.compact_types = {"p2b": "i2", "h": "i4", "i": "i2", "j": "i2", "k": "i2",
+                              "p": "i2", "q": "i2", "t": "i2", "region": "i1"}
+        self.categories = self._load_categories()
+
+        # Columns that get_dataframe returns as categorical, the dates are kept
+        self.categorical_headers = [
+            'p36', 'p37', 'weekday(p2a)', 'p2b', 'p6', 'p7', 'p8', 'p9', 'p10',
+            'p11', 'p12', 'p14', 'p15', 'p16', 'p17', 'p18', 'p19', 'p20', 'p21', 'p22',
+            'p23', 'p24', 'p27', 'p28', 'p34', 'p35', 'p39', 'p44', 'p45a', 'p47', 'p48a',
+            'p49', 'p50a', 'p50b', 'p51', 'p52', 'p53', 'p55a', 'p57', 'p58', 'h', 'i', 'j',
+            'k', 'l', 'n', 'o', 'p', 'q', 'r', 's', 't', 'p5a', 'region']
+
+        # Zips are downloaded concurrently over a pool of kept-alive connections
+        self.download_workers = download_workers
+        self.chunk_size = chunk_size
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=download_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        # The zips listed on the page are cached for index_ttl seconds,
+        # then the page is requested again only if it was modified.
+        # With offline, the page is never requested if any zip is downloaded.
+        self.index_ttl = index_ttl
+        self.offline = offline
 
     def download_data(self):
         """
         Requests the page, finds all available zips
         and downloads only the relevant ones into self.folder.
         """
-        html_page = self._request_html_page()
-        hrefs = self._get_zip_hrefs(html_page)
+        hrefs = self._get_index_hrefs(revalidate=True)
         urls_and_paths = self._get_urls_and_paths(hrefs)
+        self._download_files(list(urls_and_paths))
 
-        for url, path in urls_and_paths:
-            self._download_file(url, path)
+    def _get_index_hrefs(self, revalidate=False):
+        """
+        Returns the hrefs of zips listed on the page at self.url.
+        The hrefs are cached in a file together with the ETag and
+        Last-Modified headers of the page. The cached hrefs are returned
+        while they are younger than self.index_ttl, unless revalidate is set.
+        Otherwise, a conditional request is sent, which downloads
+        and parses the page only if it was modified.
+        """
+        index = self._load_index()
+        if index is not None and index["url"] != self.url:
+            index = None
+        if index is not None and not revalidate and \
+                time.time() - index["fetched"] < self.index_ttl:
+            return index["hrefs"]
+
+        conditional_headers = {}
+        if index is not None and index["etag"] is not None:
+            conditional_headers['If-None-Match'] = index["etag"]
+        if index is not None and index["last_modified"] is not None:
+            conditional_headers['If-Modified-Since'] = index["last_modified"]
+
+        response = self._request_html_page(conditional_headers)
+        if response.status_code == 304:  # Not modified
+            index["fetched"] = time.time()
+        else:
+            index = {"url": self.url,
+                     "etag": response.headers.get('ETag'),
+                     "last_modified": response.headers.get('Last-Modified'),
+                     "fetched": time.time(),
+                     "hrefs": self._get_zip_hrefs(response.text)}
+        self._save_json(self._get_index_file_path(), index)
+        return index["hrefs"]
+
+    def _get_index_file_path(self):
+        return self._get_metadata_file_path("index")
+
+    def _load_index(self):
+        file_path = self._get_index_file_path()
+        if os.path.isfile(file_path):
+            with open(file_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return None
 
-    def _request_html_page(self):
+    def _request_html_page(self, conditional_headers=None):
         cookies = {
             '_ranaCid': '1991771124.1594660423',
             '_ga': 'GA1.2.1948604486.1594660423',
@@ -156,9 +366,10 @@ class DataDownloader:
             'Sec-Fetch-Dest': 'document',
             'Accept-Language': 'en-US,en;q=0.9',
         }
+        headers.update(conditional_headers or {})
 
-        response = requests.get('https://ehw.fit.vutbr.cz/izv/',
-                                headers=headers, cookies=cookies).text
+        response = self.session.get(self.url, headers=headers, cookies=cookies)
+        response.raise_for_status()
         return response
 
     def _get_zip_hrefs(self, html):
@@ -177,6 +388,9 @@ class DataDownloader:
             yield file_url, file_path
 
     def _get_latest_paths_for_each_year(self, file_paths):
+        return [path for path, year in self._get_latest_paths_and_years(file_paths)]
+
+    def _get_latest_paths_and_years(self, file_paths):
         file_names = np.array([Path(path).name for path in file_paths])
         grouped_files = self._group_files_by_year(file_names, file_paths)
 
@@ -184,7 +398,7 @@ class DataDownloader:
         for file_names, file_paths, year in grouped_files:
             latest_path = self._get_latest_path_in_year(file_names, file_paths, year)
             if latest_path is not None:
-                latest_paths.append(latest_path)
+                latest_paths.append((latest_path, year))
         return latest_paths
 
     def _group_files_by_year(self, file_names, file_paths):
@@ -225,13 +439,67 @@ class DataDownloader:
                 latest_file_path = file_paths[i]
         return latest_file_path
 
+    def _download_files(self, urls_and_paths):
+        """
+        Downloads the files concurrently with self.download_workers threads.
+        Returns the number of downloaded files.
+        """
+        with ThreadPoolExecutor(max_workers=self.download_workers) as executor:
+            # list() propagates the first error of the transfers
+            list(executor.map(lambda url_and_path: self._download_file(*url_and_path),
+                              urls_and_paths))
+        return len(urls_and_paths)
+
     def _download_file(self, source_url, save_file_path):
-        request = requests.get(source_url, stream=True)
-        with open(save_file_path, 'wb') as fd:
-            for chunk in request.iter_content(chunk_size=128):
-                fd.write(chunk)
+        """
+        Downloads the file to a partial file first, which is renamed
+        once it is verified to be a valid zip. A partial file left
+        by an interrupted download is resumed with an HTTP Range request.
 
-    def parse_region_data(self, region, check_for_updates=True):
+        Raises
+        ------
+        zipfile.BadZipFile
+            Raises BadZipFile if the downloaded file is not a valid zip.
+        """
+        partial_file_path = save_file_path + ".part"
+        for resume in [True, False]:
+            if not resume and os.path.isfile(partial_file_path):
+                os.remove(partial_file_path)
+            self._download_to_partial_file(source_url, partial_file_path)
+            if self._is_valid_zip(partial_file_path):
+                os.replace(partial_file_path, save_file_path)
+                return
+            # A resumed file may be broken by a changed source, download it whole once more
+
+        os.remove(partial_file_path)
+        raise zipfile.BadZipFile(F"Downloaded file is not a valid zip: {source_url}")
+
+    def _download_to_partial_file(self, source_url, partial_file_path):
+        offset = 0
+        if os.path.isfile(partial_file_path):
+            offset = os.path.getsize(partial_file_path)
+
+        headers = {'Range': F"bytes={offset}-"} if offset > 0 else {}
+        with self.session.get(source_url, headers=headers, stream=True) as response:
+            if response.status_code == 416:  # The partial file is already complete
+                return
+            response.raise_for_status()
+
+            # The server may ignore the range and send the whole file
+            mode = 'ab' if response.status_code == 206 else 'wb'
+            with open(partial_file_path, mode) as fd:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    fd.write(chunk)
+
+    def _is_valid_zip(self, file_path):
+        try:
+            with zipfile.ZipFile(file_path, 'r') as archive:
+                return archive.testzip() is None
+        except zipfile.BadZipFile:
+            return False
+
+    def parse_region_data(self, region, check_for_updates=True, columns=None,
+                          filters=None):
         """
         Given a region name, it parses information about the region
         from zip files in self.folder. If a file is missing, it is downloaded.
@@ -242,6 +510,17 @@ class DataDownloader:
             A three-character abbreviation of a region.
         check_for_updates : bool
             A flag indicating whether it should check for new files or missing ones.
+        columns : list of strings, optional
+            The header names of columns to parse, in the order they are returned.
+            The default is None. If None, all columns are parsed.
+        filters : dict, optional
+            Conditions that the returned rows must match, see get_list.
+            Yearly zips outside the date range of p2a are not read at all.
+
+        Raises
+        ------
+        ValueError
+            Raises ValueError if an unknown region or column is requested.
 
         Returns
         -------
@@ -249,58 +528,349 @@ class DataDownloader:
             Returns a tuple containing header names and a list of numpy arrays.
 
         """
-        file_name = self._try_convert_region_to_filename(region)
+        self._try_convert_region_to_filename(region)
+        column_indices = self._get_column_indices(columns)
+        filters = self._get_filters(filters)
         if check_for_updates:
             self._download_files_if_not_exist()
-        file_paths = self._get_data_file_paths()
-        file_paths = self._get_latest_paths_for_each_year(file_paths)
+        regions_features = self._parse_regions_data([region], column_indices, filters)
+        return self._project_features(regions_features[region], column_indices)
+
+    def _get_column_indices(self, columns):
+        """
+        Converts header names into indices to self.headers.
+        """
+        header_names = self.headers[..., 0].tolist()
+        if columns is None:
+            return list(range(len(header_names)))
+
+        for column in columns:
+            if column not in header_names:
+                raise ValueError(F"Unknown column: {column}")
+        return [header_names.index(column) for column in columns]
+
+    def _get_filters(self, filters):
+        """
+        Converts filters into a dictionary of inclusive bounds (low, high)
+        for indices to self.headers. A bound is None if the column is
+        not bounded from that side.
+        Values of compact category columns are kept, they are converted
+        to codes by _get_filter_mask of the process which encoded the column.
+        """
+        if filters is None:
+            return {}
+
+        column_indices = self._get_column_indices(list(filters))
+        bounds = {}
+        for i, condition in zip(column_indices, filters.values()):
+            header_name, header_type = self.headers[i]
+            if header_name == "region":
+                raise ValueError("Rows cannot be filtered by region, "
+                                 "select the regions instead.")
+
+            low, high = condition if isinstance(condition, tuple) else (condition, condition)
+            if header_type.startswith("datetime64"):
+                low = None if low is None else np.datetime64(low, "D")
+                high = None if high is None else np.datetime64(high, "D")
+            elif self._is_category_column(header_name):
+                if low != high:
+                    raise ValueError("Only equality filters are supported "
+                                     F"on compact column {header_name}.")
+            bounds[i] = (low, high)
+        return bounds
+
+    def _get_filter_mask(self, features, filters):
+        """
+        Returns a boolean mask of rows matching all filters.
+        Invalid values, such as NaN or NaT, never match.
+        A value of a compact category column that is not among
+        the categories matches no row.
+        """
+        rows_count = len(features[next(iter(filters))])
+        mask = np.full(rows_count, True)
+        for i, (low, high) in filters.items():
+            header_name = self.headers[i][0]
+            if self._is_category_column(header_name):
+                code = self.categories.get(header_name, {}).get(low)
+                if code is None:
+                    mask[:] = False
+                else:
+                    mask &= features[i] == code
+                continue
+            if low is not None:
+                mask &= features[i] >= low
+            if high is not None:
+                mask &= features[i] <= high
+        return mask
+
+    def _filter_features(self, features, filters):
+        if not filters or features is None:
+            return features
+        mask = self._get_filter_mask(features, filters)
+        return [None if column is None else column[mask] for column in features]
+
+    def _is_year_filtered_out(self, year, filters):
+        """
+        Checks whether the year is outside the date range of p2a.
+        Each yearly zip contains only accidents of that year.
+        """
+        date_index = self._get_column_indices(["p2a"])[0]
+        if date_index not in filters:
+            return False
+
+        low, high = filters[date_index]
+        year = np.datetime64(str(year), "Y")
+        return (low is not None and year < low.astype("datetime64[Y]")) or \
+            (high is not None and year > high.astype("datetime64[Y]"))
+
+    def _project_features(self, features, column_indices):
+        """
+        Selects the columns from features, which hold an array
+        or None for every header.
+        Returns a tuple containing header names and a list of numpy arrays.
+        """
+        headers = [self.headers[i][0] for i in column_indices]
+        if features is None:
+            return headers, None
+        return headers, [features[i] for i in column_indices]
+
+    def _parse_regions_data(self, regions, column_indices, filters=None):
+        """
+        Parses several regions from the latest zip files of each year.
+        Returns a dictionary of features for each region, the columns
+        that were not requested are None.
+        """
+        file_paths = [file_path for file_path, year
+                      in self._get_latest_paths_and_years(self._get_data_file_paths())
+                      if not self._is_year_filtered_out(year, filters or {})]
+        partitions = self._parse_partitions(regions, file_paths, column_indices, filters)
+        return {region: self._merge_features([partitions[(region, file_path)]
+                                              for file_path in file_paths])
+                for region in regions}
+
+    def _parse_partitions(self, regions, file_paths, column_indices, filters=None):
+        """
+        Parses several regions in a single sweep over the zip files,
+        each zip file is opened only once.
+        Returns a dictionary of features for each region and zip file.
+        """
+        file_names = {region: self._try_convert_region_to_filename(region)
+                      for region in regions}
 
-        features = None
+        partitions = {}
         for file_path in file_paths:
-            file_features = self._parse_region_data_from_file(file_path, file_name)
-            file_features[-1][...] = region
-            features = self._concatenate_features(features, file_features)
-        return self.headers[..., 0].tolist(), features
+            with zipfile.ZipFile(file_path, 'r') as archive:
+                for region, file_name in file_names.items():
+                    file_features = self._parse_region_data_from_archive(
+                        archive, file_name, column_indices, filters)
+                    if file_features[-1] is not None:
+                        file_features[-1][...] = self._get_region_value(region)
+                    partitions[(region, file_path)] = file_features
+        return partitions
+
+    def _get_latest_file_paths(self):
+        file_paths = self._get_data_file_paths()
+        return self._get_latest_paths_for_each_year(file_paths)
 
     def _get_data_file_paths(self):
         return glob.glob(os.path.join(self.folder, "*.zip"))
 
-    def _parse_region_data_from_file(self, file_path, file_name):
-        archive = zipfile.ZipFile(file_path, 'r')
-        lines_count = self._file_lines_count(archive, file_name)
-        file_features = self._create_empty_arrays(lines_count)
-
-        with archive.open(file_name, "r") as file:
-            io_wrapper = io.TextIOWrapper(file, "Windows-1250")
-            reader = csv.reader(io_wrapper, delimiter=';', quotechar='"')
-
-            for row_index, row in enumerate(reader):
-                feature_col = 0
-                for i in range(len(row)):  # For each column
-                    if self.headers[i][1] == "f8":
-                        row[i] = row[i].replace(',', '.')
-                    try:
-                        file_features[feature_col][row_index] = row[i]
-                    except ValueError:
-                        pass
+    def _parse_region_data_from_file(self, file_path, file_name, column_indices=None,
+                                     filters=None):
+        with zipfile.ZipFile(file_path, 'r') as archive:
+            return self._parse_region_data_from_archive(archive, file_name,
+                                                        column_indices, filters)
+
+    def _parse_region_data_from_archive(self, archive, file_name, column_indices=None,
+                                        filters=None):
+        if column_indices is None:
+            column_indices = self._get_column_indices(None)
+        # The file is decompressed only once, both engines parse the buffer
+        raw_content = archive.read(file_name)
+        return self.parsers[self.parser](raw_content, column_indices, filters or {})
+
+    def _parse_rows(self, raw_content, column_indices, filters):
+        """
+        Parses the csv file row by row, assigning each cell separately.
+        Rows not matching the filters are dropped afterwards.
+        """
+        parsed_indices = sorted(set(column_indices) | set(filters))
+        lines_count = self._file_lines_count(raw_content)
+        file_features = self._create_empty_arrays(lines_count, parsed_indices)
+
+        for row_index, row in enumerate(self._csv_reader(raw_content)):
+            feature_col = 0
+            for i in range(len(row)):  # For each column
+                if file_features[feature_col] is None:  # Not requested
                     feature_col += 1
-            return file_features
+                    continue
+                if self.headers[i][1] == "f8":
+                    row[i] = row[i].replace(',', '.')
+                try:
+                    file_features[feature_col][row_index] = row[i]
+                except ValueError:
+                    pass
+                feature_col += 1
+
+        file_features = [None if column is None else self._compact_column(i, column)
+                         for i, column in enumerate(file_features)]
+        file_features = self._filter_features(file_features, filters)
+        return [column if i in column_indices else None
+                for i, column in enumerate(file_features)]
+
+    def _parse_bulk(self, raw_content, column_indices, filters):
+        """
+        Reads all rows of the csv file at once and converts
+        the requested features column by column.
+        Rows not matching the filters are dropped before the conversion
+        of the requested features.
+        Falls back to _parse_rows if the rows are not of equal length.
+        """
+        rows = list(self._csv_reader(raw_content))
+
+        columns_count = len(self.headers) - 1  # region is not in the file
+        if any(len(row) != columns_count for row in rows):
+            return self._parse_rows(raw_content, column_indices, filters)
+
+        if filters:
+            filter_features = self._create_empty_arrays(len(rows), list(filters))
+            for i in filters:
+                values = [row[i] for row in rows]
+                self._fill_column(filter_features[i], values, self.headers[i][1])
+                filter_features[i] = self._compact_column(i, filter_features[i])
+            mask = self._get_filter_mask(filter_features, filters)
+            rows = [row for row, matches in zip(rows, mask) if matches]
+
+        file_features = self._create_empty_arrays(len(rows), column_indices)
+        for i in column_indices:
+            if i < columns_count:
+                values = [row[i] for row in rows]
+                self._fill_column(file_features[i], values, self.headers[i][1])
+            file_features[i] = self._compact_column(i, file_features[i])
+        return file_features
+
+    def _compact_column(self, i, column):
+        """
+        Converts a parsed column of a single file to its compact type,
+        if compact is enabled. Other columns are returned unchanged.
+        """
+        header_name = self.headers[i][0]
+        if not self.compact or header_name not in self.compact_types:
+            return column
+
+        if header_name == "region":  # Filled in after parsing
+            return np.full(len(column), -1, dtype=self.compact_types[header_name])
+        if header_name == "p2b":
+            return self._encode_minutes(column)
+        return self._encode_categories(header_name, column)
+
+    def _encode_minutes(self, column):
+        """
+        Converts times hhmm to minutes since midnight.
+        Invalid times, such as the unknown hour 25, are -1.
+        """
+        minutes = np.full(len(column), -1, dtype=self.compact_types["p2b"])
+        valid = (np.char.str_len(column) == 4) & np.char.isdecimal(column)
+        hours, mins = np.divmod(column[valid].astype("i2"), 100)
+        in_range = (hours < 24) & (mins < 60)
+        minutes[np.flatnonzero(valid)[in_range]] = (hours * 60 + mins)[in_range]
+        return minutes
+
+    def _is_category_column(self, header_name):
+        """
+        Checks whether the column holds codes of categories in compact mode.
+        """
+        return self.compact and header_name in self.compact_types and \
+            header_name not in ("p2b", "region")
+
+    def _encode_categories(self, header_name, column):
+        unique_values, inverse = np.unique(column, return_inverse=True)
+        unique_codes = [self._get_category_code(header_name, value)
+                        for value in unique_values.tolist()]
+        unique_codes = np.array(unique_codes, dtype=self.compact_types[header_name])
+        return unique_codes[inverse.reshape(-1)]
+
+    def _get_category_code(self, header_name, value):
+        """
+        Returns the code of the category, new categories are appended
+        so that the codes of the existing ones never change.
+        """
+        codes = self.categories.setdefault(header_name, {})
+        if value not in codes:
+            if len(codes) > np.iinfo(self.compact_types[header_name]).max:
+                raise ValueError(F"Too many categories in column {header_name}.")
+            codes[value] = len(codes)
+        return codes[value]
+
+    def _get_region_value(self, region):
+        if self.compact:
+            return self._get_category_code("region", region)
+        return region
+
+    def get_categories(self, header_name):
+        """
+        Returns categories of a compact column, the codes in the column
+        are indices to the returned array.
+        """
+        return np.array(list(self.categories.get(header_name, {})))
+
+    def _fill_column(self, column, values, header_type):
+        """
+        Converts string values into the column at once.
+        Invalid values are left untouched, the same way as
+        assigning them one by one.
+        """
+        if header_type == "f8":
+            values = [value.replace(',', '.') for value in values]
+        values = np.array(values)
 
-    def _file_lines_count(self, archive, file_name):
-        with archive.open(file_name, "r") as file:
-            for i, l in enumerate(file, 1):
-                pass
-            return i
-        return 0
+        # Empty numbers are invalid, empty dates are converted to NaT
+        if column.dtype.kind in "iuf":
+            valid = values != ""
+        else:
+            valid = np.full(len(values), True)
 
-    def _create_empty_arrays(self, lines_count):
+        try:
+            column[valid] = values[valid]
+        except (ValueError, OverflowError):
+            # Convert each distinct value on its own, skipping the invalid ones
+            unique_values, inverse = np.unique(values[valid], return_inverse=True)
+            converted = np.empty(len(unique_values), dtype=column.dtype)
+            converted_valid = np.full(len(unique_values), True)
+            for i, value in enumerate(unique_values):
+                try:
+                    converted[i] = value
+                except ValueError:
+                    converted_valid[i] = False
+            mask = converted_valid[inverse]
+            column[np.flatnonzero(valid)[mask]] = converted[inverse][mask]
+
+    def _csv_reader(self, raw_content):
+        io_wrapper = io.TextIOWrapper(io.BytesIO(raw_content), "Windows-1250")
+        return csv.reader(io_wrapper, delimiter=';', quotechar='"')
+
+    def _file_lines_count(self, raw_content):
+        """
+        Counts lines the same way as iterating over the file does,
+        the last line does not have to end with a newline.
+        """
+        lines_count = raw_content.count(b"\n")
+        if raw_content and not raw_content.endswith(b"\n"):
+            lines_count += 1
+        return lines_count
+
+    def _create_empty_arrays(self, lines_count, column_indices):
         """
-        Initializes empty ndarrays for features.
+        Initializes empty ndarrays for requested features,
+        the others are None.
         Float arrays are initializes to np.nan,
         everything else to -1.
         """
         file_features = []
-        for header_name, header_type in self.headers:
+        for i, (header_name, header_type) in enumerate(self.headers):
+            if i not in column_indices:
+                file_features.append(None)
+                continue
             if header_type == "f8":
                 fill_value = np.nan
             else:
@@ -311,16 +881,15 @@ class DataDownloader:
         return file_features
 
     def _download_files_if_not_exist(self):
-        html_page = self._request_html_page()
-        hrefs = self._get_zip_hrefs(html_page)
+        if self.offline and len(self._get_data_file_paths()) > 0:
+            return 0
+
+        hrefs = self._get_index_hrefs()
         urls_and_paths = self._get_urls_and_paths(hrefs)
 
-        downloaded_count = 0
-        for url, path in urls_and_paths:
-            if not os.path.isfile(path):
-                self._download_file(url, path)
-                downloaded_count += 1
-        return downloaded_count
+        missing_urls_and_paths = [(url, path) for url, path in urls_and_paths
+                                  if not os.path.isfile(path)]
+        return self._download_files(missing_urls_and_paths)
 
     def _try_convert_region_to_filename(self, region):
         try:
@@ -334,14 +903,57 @@ class DataDownloader:
             index += 6
         return F"{index:02.0f}.csv"
 
-    def _concatenate_features(self, features1, features2):
-        if features1 is None:
-            return features2
-        for i in range(len(features2)):
-            features1[i] = np.concatenate([features1[i], features2[i]], axis=0)
-        return features1
+    def _merge_features(self, features_list):
+        """
+        Concatenates features of several files or regions.
+        Each column is allocated only once, the given features
+        are left untouched.
+        """
+        if len(features_list) == 0:
+            return None
+        if len(features_list) == 1:
+            return list(features_list[0])
+        return [None if any(column is None for column in columns)
+                else np.concatenate(columns, axis=0)
+                for columns in zip(*features_list)]
+
+    def _merge_features_to_buffer(self, features_list):
+        """
+        Concatenates features into read-only columns, which are views
+        of a single buffer. Each column is aligned to 8 bytes.
+        """
+        if len(features_list) == 0:
+            return None
+        columns_list = list(zip(*features_list))
+        offsets = [0]
+        for columns in columns_list:
+            nbytes = sum(column.nbytes for column in columns)
+            offsets.append(offsets[-1] + (nbytes + 7) // 8 * 8)
+
+        buffer = np.empty(offsets[-1], dtype=np.uint8)
+        merged = []
+        for columns, offset in zip(columns_list, offsets):
+            dtype = columns[0].dtype
+            rows = sum(column.shape[0] for column in columns)
+            column = buffer[offset:offset + rows * dtype.itemsize].view(dtype)
+            np.concatenate(columns, axis=0, out=column)
+            column.flags.writeable = False
+            merged.append(column)
+        return merged
+
+    def _merge_columns(self, features1, features2):
+        """
+        Combines features of the same rows with different columns parsed,
+        the columns of features2 take precedence.
+        """
+        return [column1 if column2 is None else column2
+                for column1, column2 in zip(features1, features2)]
 
-    def get_list(self, regions=None):
+    def _has_columns(self, features, column_indices):
+        return features is not None and \
+            all(features[i] is not None for i in column_indices)
+
+    def get_list(self, regions=None, workers=1, columns=None, filters=None, read_only=False):
         """
         Returns information about accidents for specified regions.
         First, it tries to find the information in a cache variable,
@@ -349,6 +961,10 @@ class DataDownloader:
         and lastly, it calls parse_region_data to retrieve the
         information for a particular
         region.
+        The files cache each region in partitions, one for each zip file.
+        When a zip file is added or replaced, only its partitions are parsed again.
+        The .npy cache also keeps each region merged from its partitions,
+        which is memory-mapped instead of concatenated on the next loads.
 
 
         Parameters
@@ -356,11 +972,32 @@ class DataDownloader:
         regions : list of strings, optional
             The list of regions to retrieve information about.
             The default is None. If None, all regions are selected.
+        workers : int, optional
+            The number of processes parsing regions missing in cache.
+            The default is 1, which parses them in this process.
+        columns : list of strings, optional
+            The header names of columns to retrieve, in the order they are returned.
+            Only these columns are parsed or read from the cache.
+            The default is None. If None, all columns are selected.
+        filters : dict, optional
+            Conditions that the returned rows must match. Maps header names
+            to either a value the column must be equal to, or a tuple (low, high)
+            of inclusive bounds where None leaves that side unbounded, e.g.
+            {"p2a": ("2019-01-01", "2019-12-31"), "p11": (7, None), "p36": 1}.
+            Regions missing in cache are parsed without the non-matching rows
+            and are not cached. With compact, p2b is compared in minutes
+            and the other compact columns support only equality.
+            The default is None, which keeps all rows.
+        read_only : bool, optional
+            Returns read-only arrays sharing a single buffer. Without filters,
+            the result is kept in the cache variable and returned again
+            without copying while the cached regions do not change.
+            The default is False, which returns new arrays.
 
         Raises
         ------
         ValueError
-            Raises ValueError if an unknown region is requested..
+            Raises ValueError if an unknown region or column is requested.
 
         Returns
         -------
@@ -370,51 +1007,606 @@ class DataDownloader:
         if regions is None:
             regions = self.regions
 
-        downloaded = self._download_files_if_not_exist()
-        if downloaded > 0:  # if a new file is downloaded, delete all cache
-            self._clear_cache()
-
-        features = None
-
         for region in regions:
             if region not in self.regions:
                 raise ValueError(F"Unknown region: {region}")
+        column_indices = self._get_column_indices(columns)
+        filters = self._get_filters(filters)
+        # Cached regions are filtered after loading the filtered columns too
+        cached_indices = sorted(set(column_indices) | set(filters))
+
+        self._download_files_if_not_exist()
+        file_paths = self._get_latest_file_paths()
+        # Only partitions of new or changed zip files are parsed again
+        self._update_manifest(file_paths)
+
+        headers = [self.headers[i][0] for i in column_indices]
+        result_key = (tuple(regions), tuple(column_indices))
+        if read_only and not filters:
+            features = self.region_cache.get_result(self._get_region_cache_namespace(), result_key)
+            if features is not None:
+                return headers, features
+
+        # The regions are referenced here, as they may be evicted from the cache variable
+        regions_data = {}
+        regions_to_parse = []
+        cached_partitions = {}
+        for region in regions:
+            if region in regions_data or region in regions_to_parse:
+                continue
+            region_data = self._get_region_data_from_variable(region)
+            if self._has_columns(region_data, cached_indices):
+                regions_data[region] = region_data
+                continue
 
-            region_features = self._get_region_data_from_variable(region)
-            if region_features is not None:
-                features = self._concatenate_features(features, region_features)
+            region_data = self._get_merged_region_data_from_file(region, cached_indices)
+            if self._has_columns(region_data, cached_indices):
+                regions_data[region] = self._save_region_data_to_variable(region, region_data)
                 continue
 
-            region_features = self._get_region_data_from_file(region)
-            if region_features is not None:
-                self._save_region_data_to_variable(region, region_features)
-                features = self._concatenate_features(features, region_features)
+            region_partitions = self._get_region_data_from_file(region, cached_indices, file_paths)
+            if all(self._has_columns(partition, cached_indices)
+                   for partition in region_partitions.values()):
+                regions_data[region] = self._save_region_data_to_variable(
+                    region, self._save_merged_region_data(
+                        region, self._merge_features(list(region_partitions.values()))))
                 continue
 
-            _, region_features = self.parse_region_data(region, check_for_updates=False)
-            self._save_region_data_to_variable(region, region_features)
-            self._save_region_data_to_file(region, region_features)
-            features = self._concatenate_features(features, region_features)
+            regions_to_parse.append(region)
+            cached_partitions.update(region_partitions)
+
+        if filters:
+            file_paths = [file_path for file_path, year in self._get_latest_paths_and_years(file_paths)
+                          if not self._is_year_filtered_out(year, filters)]
+            partitions = self._parse_regions(regions_to_parse, workers, file_paths,
+                                             column_indices, filters)
+            parsed_features = {
+                region: self._merge_features([partitions[(region, file_path)]
+                                              for file_path in file_paths])
+                for region in regions_to_parse}
+        else:
+            regions_data.update(self._parse_missing_partitions(
+                regions_to_parse, workers, file_paths, cached_indices, cached_partitions))
+            parsed_features = {}
+
+        regions_features = []
+        for region in regions:
+            if region in parsed_features:
+                region_features = parsed_features[region]
+            else:
+                region_features = self._filter_features(regions_data[region], filters)
+            regions_features.append(self._project_features(region_features, column_indices)[1])
+
+        if not read_only:
+            return headers, self._merge_features(regions_features)
 
-        return self.headers[..., 0].tolist(), features
+        features = self._merge_features_to_buffer(regions_features)
+        if not filters and features is not None:
+            self.region_cache.put_result(self._get_region_cache_namespace(), result_key, features)
+        return headers, features
+
+    def iter_chunks(self, regions=None, columns=None, filters=None, chunk_rows=None):
+        """
+        Yields information about accidents for specified regions in chunks,
+        so that only a single chunk is held in memory at once.
+        Each region and zip file is a separate chunk, which is read from the
+        cache files if possible, otherwise it is parsed and saved to cache.
+        The cache variable is not used.
+
+        Parameters
+        ----------
+        regions : list of strings, optional
+            The list of regions to retrieve information about.
+            The default is None. If None, all regions are selected.
+        columns : list of strings, optional
+            The header names of columns to retrieve, see get_list.
+        filters : dict, optional
+            Conditions that the returned rows must match, see get_list.
+        chunk_rows : int, optional
+            The maximum number of rows in a chunk. Larger chunks are split.
+            The default is None, which yields whole chunks.
+
+        Raises
+        ------
+        ValueError
+            Raises ValueError if an unknown region or column is requested,
+            or if chunk_rows is not positive.
+
+        Yields
+        ------
+        2-D Tuple
+            A tuple containing header names and a list of numpy arrays.
+        """
+        if regions is None:
+            regions = self.regions
+
+        for region in regions:
+            if region not in self.regions:
+                raise ValueError(F"Unknown region: {region}")
+        if chunk_rows is not None and chunk_rows < 1:
+            raise ValueError("Invalid chunk_rows parameter: It must be positive.")
+        column_indices = self._get_column_indices(columns)
+        filters = self._get_filters(filters)
+
+        self._download_files_if_not_exist()
+        file_paths = self._get_latest_file_paths()
+        self._update_manifest(file_paths)
+        file_paths = [file_path for file_path, year in self._get_latest_paths_and_years(file_paths)
+                      if not self._is_year_filtered_out(year, filters)]
+
+        headers = [self.headers[i][0] for i in column_indices]
+        for region in regions:
+            for file_path in file_paths:
+                features = self._get_partition_features(region, file_path, column_indices, filters)
+                rows = features[0].shape[0] if features else 0
+                step = chunk_rows or max(rows, 1)
+                for start in range(0, rows, step):
+                    yield headers, [column[start:start + step] for column in features]
+
+    def _get_partition_features(self, region, file_path, column_indices, filters=None):
+        """
+        Reads the columns of a single partition from the cache files if possible,
+        otherwise it parses the partition and saves it to cache.
+        """
+        filters = filters or {}
+        cached_indices = sorted(set(column_indices) | set(filters))
+        features = self._get_region_data_from_file(
+            region, cached_indices, [file_path])[(region, file_path)]
+        if self._has_columns(features, cached_indices):
+            features = self._filter_features(features, filters)
+        else:
+            features = self._parse_and_save_partitions(
+                [region], [file_path], column_indices, filters)[(region, file_path)]
+        return self._project_features(features, column_indices)[1]
+
+    def get_aggregates(self, regions=None, by=("region", "year")):
+        """
+        Returns the number of accidents and the sums of casualties
+        grouped by the given columns, without reading the rows.
+        The aggregates of each partition are built when it is parsed
+        with all needed columns, or on the first call, and they are
+        saved beside the cache files.
+
+        Parameters
+        ----------
+        regions : list of strings, optional
+            The list of regions to aggregate.
+            The default is None. If None, all regions are selected.
+        by : list of strings, optional
+            The columns to group by: region, year, month
+            and the header names in self.cube_attributes.
+            With compact, string attributes hold codes, see get_categories.
+            The default is ("region", "year").
+
+        Raises
+        ------
+        ValueError
+            Raises ValueError if an unknown region or column is requested.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Returns the columns of by, followed by the count of accidents
+            and sums of p13a, p13b and p13c, sorted by the columns of by.
+        """
+        if regions is None:
+            regions = self.regions
+
+        for region in regions:
+            if region not in self.regions:
+                raise ValueError(F"Unknown region: {region}")
+        for column in by:
+            if column not in ["region", "year", "month", *self.cube_attributes]:
+                raise ValueError(F"Unknown column: {column}")
+
+        self._download_files_if_not_exist()
+        file_paths = self._get_latest_file_paths()
+        self._update_manifest(file_paths)
+
+        cubes = []
+        for region in regions:
+            for file_path in file_paths:
+                cube = self._get_partition_cube(region, file_path)
+                cube["region"] = region
+                cubes.append(cube)
+        cube = pd.concat(cubes, ignore_index=True)
+        cube["year"] = cube["month"].dt.year
+
+        return cube.groupby(list(by), dropna=False, sort=True)[["count", *self.cube_values]] \
+            .sum().reset_index()
+
+    def _get_partition_cube(self, region, file_path):
+        key = self._get_partition_key(region, file_path)
+        cube = self._load_cube(key)
+        if cube is None:
+            column_indices = self._get_column_indices(self._get_cube_columns())
+            features = self._get_partition_features(region, file_path, column_indices)
+            cube = self._build_cube(dict(zip(self._get_cube_columns(), features)))
+            self._save_cube(key, cube)
+        return pd.DataFrame(cube)
+
+    def _get_cube_columns(self):
+        return ["p2a", *self.cube_values, *self.cube_attributes]
+
+    def _build_cube(self, columns):
+        """
+        Aggregates the columns of a partition by month and attributes.
+        Invalid negative casualties are not summed.
+        """
+        df = pd.DataFrame({"month": columns["p2a"].astype("datetime64[M]"),
+                           **{name: columns[name] for name in self.cube_attributes},
+                           **{name: np.maximum(columns[name], 0).astype("i8")
+                              for name in self.cube_values}})
+        grouped = df.groupby(["month", *self.cube_attributes], dropna=False, sort=True)
+        cube = grouped[self.cube_values].sum()
+        cube["count"] = grouped.size()
+        cube = cube.reset_index()
+        return {name: cube[name].to_numpy() for name in cube.columns}
+
+    def _get_cube_file_path(self, key):
+        return self._get_metadata_file_path(F"{key}.cube", ".npz")
+
+    def _load_cube(self, key):
+        """
+        Returns None if the cube does not exist or has other attributes.
+        """
+        file_path = self._get_cube_file_path(key)
+        if not os.path.isfile(file_path):
+            return None
+        with np.load(file_path) as cube:
+            if list(cube["attributes"]) != self.cube_attributes:
+                return None
+            return {name: cube[name] for name in cube.files if name != "attributes"}
+
+    def _save_cube(self, key, cube):
+        file_path = self._get_cube_file_path(key)
+        with open(file_path + ".tmp", "wb") as f:
+            np.savez(f, attributes=np.array(self.cube_attributes, dtype=str), **cube)
+        os.replace(file_path + ".tmp", file_path)
+
+    def get_dataframe(self, regions=None, columns=None, filters=None, workers=1):
+        """
+        Returns information about accidents for specified regions
+        as a pandas DataFrame, see get_list for the parameters.
+        The columns wrap the arrays of get_list without copying them,
+        except for the columns in self.categorical_headers, which are categorical.
+        With compact, their codes are used directly and p2b is kept in minutes.
+        """
+        headers, features = self.get_list(regions, workers, columns, filters)
+        data = {header_name: self._get_series_values(header_name, column)
+                for header_name, column in zip(headers, features)}
+        return pd.DataFrame(data, copy=False)
+
+    def _get_series_values(self, header_name, column):
+        if header_name not in self.categorical_headers:
+            return column
+        if self.compact and header_name in self.compact_types:
+            if header_name == "p2b":
+                return column
+            values = pd.Categorical.from_codes(column, categories=self.get_categories(header_name))
+            # All regions are categories, but figures facet over the returned ones only
+            if header_name == "region":
+                return values.remove_unused_categories()
+            return values
+        return pd.Categorical(column)
+
+    def _parse_missing_partitions(self, regions, workers, file_paths, column_indices,
+                                  cached_partitions):
+        """
+        Parses the partitions of regions that are not cached or miss some columns,
+        and assembles the regions from the parsed and cached partitions.
+        Returns a dictionary of features for each region.
+        """
+        missing_partitions = [(region, file_path) for region in regions for file_path in file_paths
+                              if not self._has_columns(cached_partitions.get((region, file_path)),
+                                                       column_indices)]
+        missing_file_paths = [file_path for file_path in file_paths
+                              if any(file_path == missing for _, missing in missing_partitions)]
+        missing_column_indices = sorted({
+            i for partition in missing_partitions for i in column_indices
+            if not self._has_columns(cached_partitions.get(partition), [i])})
+
+        parsed_partitions = self._parse_regions(regions, workers, missing_file_paths,
+                                                missing_column_indices)
+
+        empty_partition = [None] * len(self.headers)
+        regions_data = {}
+        for region in regions:
+            region_partitions = [
+                self._merge_columns(cached_partitions.get((region, file_path)) or empty_partition,
+                                    parsed_partitions.get((region, file_path), empty_partition))
+                for file_path in file_paths]
+            regions_data[region] = self._save_region_data_to_variable(
+                region, self._save_merged_region_data(region, self._merge_features(region_partitions)))
+        return regions_data
+
+    def _parse_regions(self, regions, workers, file_paths, column_indices, filters=None):
+        """
+        Parses the columns of the regions from the zip files and saves
+        the partitions to cache, unless the rows are filtered.
+        With more than one worker, the regions are split into groups
+        and each group is parsed in a separate process.
+        Returns a dictionary of features for each region and zip file.
+        """
+        if workers > 1 and len(regions) > 1:
+            regions_groups = [regions[i::workers] for i in range(min(workers, len(regions)))]
+            init_params = self._get_init_params()
+            partitions = {}
+            with ProcessPoolExecutor(max_workers=len(regions_groups)) as executor:
+                for group_partitions, categories in executor.map(
+                        _parse_and_save_partitions, repeat(init_params), regions_groups,
+                        repeat(file_paths), repeat(column_indices), repeat(filters)):
+                    if self.compact:
+                        self._remap_categories(group_partitions, categories)
+                    partitions.update(group_partitions)
+
+            # The workers do not save compact partitions, their codes are remapped here
+            if self.compact and not filters:
+                for (region, file_path), features in partitions.items():
+                    self._save_partition(region, file_path, features)
+            return partitions
+
+        return self._parse_and_save_partitions(regions, file_paths, column_indices, filters)
+
+    def _parse_and_save_partitions(self, regions, file_paths, column_indices,
+                                   filters=None, save=True):
+        partitions = self._parse_partitions(regions, file_paths, column_indices, filters)
+        if save and not filters:
+            for (region, file_path), features in partitions.items():
+                self._save_partition(region, file_path, features)
+        return partitions
+
+    def _remap_categories(self, partitions, categories):
+        """
+        Converts codes of compact columns parsed by another downloader
+        to codes of self.categories.
+        """
+        for header_name, codes in categories.items():
+            i = self._get_column_indices([header_name])[0]
+            remap = np.array([self._get_category_code(header_name, value) for value in codes],
+                             dtype=self.compact_types[header_name])
+            for features in partitions.values():
+                if features is not None and features[i] is not None:
+                    features[i] = remap[features[i]]
+
+    def _get_init_params(self):
+        """
+        Returns parameters that create an equivalent downloader
+        with an empty cache variable.
+        """
+        return {"url": self.url, "folder": self.folder,
+                "cache_filename": self.cache_filename, "parser": self.parser,
+                "compact": self.compact, "download_workers": self.download_workers,
+                "chunk_size": self.chunk_size, "index_ttl": self.index_ttl,
+                "offline": self.offline, "cube_attributes": self.cube_attributes}
 
     def _clear_cache(self):
         """
         Clears cache in files and in a variable.
         """
-        self.region_cache.clear()
+        self.region_cache.clear(self._get_region_cache_namespace())
         files = glob.glob(os.path.join(self.folder, self.cache_filename.format('*')))
+        files += glob.glob(self._get_cube_file_path('*'))
         for local_file_cache in files:
             os.remove(local_file_cache)
 
+        # The manifest and codes of categories are not referenced anymore
+        for file_path in [self._get_manifest_file_path(), self._get_categories_file_path()]:
+            if os.path.isfile(file_path):
+                os.remove(file_path)
+        self.categories = self._load_categories()
+
+    def _update_manifest(self, file_paths):
+        """
+        Compares the zip files with the manifest of zip files the cached
+        partitions were parsed from. Partitions of changed, replaced or
+        removed zip files are deleted and the cache variable is cleared,
+        so that only those partitions are parsed again. The cache variable
+        is also cleared if the manifest was updated by another downloader.
+        The content is hashed only if the size or mtime of a zip file differ.
+        """
+        manifest = self._load_manifest()
+        updated_manifest = {}
+        changed = False
+
+        for file_path in file_paths:
+            archive_name = Path(file_path).name
+            stat = os.stat(file_path)
+            entry = manifest.get(archive_name)
+            if entry is not None and entry["size"] == stat.st_size \
+                    and entry["mtime"] == stat.st_mtime:
+                updated_manifest[archive_name] = entry
+                continue
+
+            content_hash = self._hash_file(file_path)
+            if entry is None or entry["sha256"] != content_hash:
+                self._remove_partitions(file_path)
+                changed = True
+            updated_manifest[archive_name] = {"size": stat.st_size, "mtime": stat.st_mtime,
+                                              "sha256": content_hash}
+
+        for archive_name in manifest.keys() - updated_manifest.keys():
+            self._remove_partitions(os.path.join(self.folder, archive_name))
+            changed = True
+
+        if updated_manifest != manifest:
+            self._save_manifest(updated_manifest)
+        if changed:
+            self.region_cache.clear(self._get_region_cache_namespace())
+        self.region_cache.validate(self._get_region_cache_namespace(), updated_manifest)
+
+    def _hash_file(self, file_path):
+        file_hash = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(2**20), b""):
+                file_hash.update(chunk)
+        return file_hash.hexdigest()
+
+    def _get_manifest_file_path(self):
+        return self._get_metadata_file_path("manifest")
+
+    def _load_manifest(self):
+        file_path = self._get_manifest_file_path()
+        if os.path.isfile(file_path):
+            with open(file_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return {}
+
+    def _save_manifest(self, manifest):
+        self._save_json(self._get_manifest_file_path(), manifest)
+
     def _get_region_data_from_variable(self, region):
-        if region in self.region_cache:
-            return self.region_cache[region]
-        return None
+        return self.region_cache.get(self._get_region_cache_namespace(), region)
+
+    def _get_region_cache_namespace(self):
+        """
+        Downloaders share regions if they parse the same zips into the same
+        cache files, compact columns hold codes of categories of these files.
+        """
+        return os.path.abspath(self.folder), self.cache_filename, self.compact
+
+    def _get_region_data_from_file(self, region, column_indices, file_paths):
+        """
+        Loads cached partitions of the region for each zip file.
+        Returns a dictionary of features for each region and zip file,
+        the features are None if the partition is not cached.
+        """
+        load, _ = self._get_cache_backend()
+        return {(region, file_path): load(self._get_partition_key(region, file_path),
+                                          column_indices)
+                for file_path in file_paths}
+
+    def _get_merged_region_data_from_file(self, region, column_indices):
+        """
+        Memory-maps the columns of the region merged from all its partitions,
+        so that a cached region is not concatenated again on every load.
+        Only the columnar cache keeps merged regions, None is returned otherwise.
+        """
+        if not self.cache_filename.endswith(".npy"):
+            return None
+        return self._load_columnar_cache(self._get_merged_key(region), column_indices)
+
+    def _save_merged_region_data(self, region, region_data):
+        """
+        Saves the columns of the region merged from the partitions
+        of all the latest zip files, if the cache is columnar.
+        Returns the memory-mapped saved columns instead of the merged ones.
+        """
+        if not self.cache_filename.endswith(".npy") or region_data is None:
+            return region_data
+        key = self._get_merged_key(region)
+        column_indices = [i for i, column in enumerate(region_data) if column is not None]
+        # Columns merged before are not written again, they may be mapped
+        saved = self._load_columnar_cache(key, column_indices) or [None] * len(self.headers)
+        self._save_columnar_cache(key, [column if saved[i] is None else None
+                                        for i, column in enumerate(region_data)])
+        return self._load_columnar_cache(key, column_indices)
+
+    def _get_merged_key(self, region):
+        """
+        e.g. OLK.merged or OLK.compact.merged, the merged files are removed
+        with the partitions of any zip file, see _remove_partitions.
+        """
+        if self.compact:
+            region = F"{region}.compact"
+        return F"{region}.merged"
 
-    def _get_region_data_from_file(self, region):
-        file_name = self.cache_filename.format(region)
-        file_path = os.path.join(self.folder, file_name)
+    def _save_region_data_to_variable(self, region, region_data):
+        """
+        Adds the parsed columns to those already cached.
+        Returns the features of the region with all cached columns.
+        """
+        cached = self.region_cache.peek(self._get_region_cache_namespace(), region)
+        if cached is not None:
+            region_data = self._merge_columns(cached, region_data)
+        self.region_cache.put(self._get_region_cache_namespace(), region, region_data)
+        return region_data
+
+    def _save_partition(self, region, file_path, features):
+        """
+        Adds the parsed columns to those already cached.
+        """
+        if self.compact:  # The categories must contain all codes of the partition
+            self._save_categories()
+        _, save = self._get_cache_backend()
+        key = self._get_partition_key(region, file_path)
+        save(key, features)
+
+        # Aggregate while the parsed columns are in memory
+        cube_indices = self._get_column_indices(self._get_cube_columns())
+        if self._has_columns(features, cube_indices) and self._load_cube(key) is None:
+            self._save_cube(key, self._build_cube(
+                {self.headers[i][0]: features[i] for i in cube_indices}))
+
+    def _get_partition_key(self, region, file_path):
+        """
+        Each region is cached in partitions, one for each zip file,
+        e.g. OLK.datagis-2019 or OLK.compact.datagis-2019
+        """
+        # Compact regions have different types, they are cached separately
+        if self.compact:
+            region = F"{region}.compact"
+        return F"{region}.{Path(file_path).stem}"
+
+    def _remove_partitions(self, file_path):
+        """
+        Removes cached partitions of all regions parsed from the zip file,
+        and the merged regions, which contain them.
+        """
+        key_pattern = F"*.{glob.escape(Path(file_path).stem)}"
+        if self.cache_filename.endswith(".npy"):
+            files = glob.glob(self._get_column_cache_file_path(key_pattern, "*"))
+            files += glob.glob(self._get_column_cache_file_path("*.merged", "*"))
+        else:
+            files = glob.glob(self._get_cache_file_path(key_pattern))
+        files += glob.glob(self._get_cube_file_path(key_pattern))
+        for local_file_cache in files:
+            os.remove(local_file_cache)
+
+    def _get_metadata_file_path(self, name, extension=".json"):
+        """
+        Metadata are stored beside the cache files,
+        e.g. data_{}.pkl.gz -> data_categories.json
+        """
+        file_name = self.cache_filename.format(name)
+        for cache_extension in self.cache_backends:
+            if file_name.endswith(cache_extension):
+                file_name = file_name[:-len(cache_extension)]
+        return os.path.join(self.folder, file_name + extension)
+
+    def _save_json(self, file_path, content):
+        with open(file_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(content, f, ensure_ascii=False)
+        os.replace(file_path + ".tmp", file_path)
+
+    def _get_categories_file_path(self):
+        return self._get_metadata_file_path("categories")
+
+    def _load_categories(self):
+        file_path = self._get_categories_file_path()
+        if self.compact and os.path.isfile(file_path):
+            with open(file_path, "r", encoding="utf-8") as f:
+                categories = json.load(f)
+            return {header_name: {value: code for code, value in enumerate(values)}
+                    for header_name, values in categories.items()}
+        return {"region": {region: code for code, region in enumerate(self.regions)}}
+
+    def _save_categories(self):
+        categories = {header_name: list(codes) for header_name, codes in self.categories.items()}
+        self._save_json(self._get_categories_file_path(), categories)
+
+    def _get_cache_backend(self):
+        for extension, backend in self.cache_backends.items():
+            if self.cache_filename.endswith(extension):
+                return backend
+
+    def _get_cache_file_path(self, key):
+        file_name = self.cache_filename.format(key)
+        return os.path.join(self.folder, file_name)
+
+    def _load_pickle_cache(self, key, column_indices):
+        # The pickle is always loaded whole
+        file_path = self._get_cache_file_path(key)
 
         if os.path.isfile(file_path):
             with open(file_path, "rb") as f:
@@ -423,19 +1615,104 @@ class DataDownloader:
             return pickle.loads(decompressed)
         return None
 
-    def _save_region_data_to_variable(self, region, region_data):
-        self.region_cache[region] = region_data
+    def _save_pickle_cache(self, key, data):
+        file_path = self._get_cache_file_path(key)
 
-    def _save_region_data_to_file(self, region, region_data):
-        file_name = self.cache_filename.format(region)
-        file_path = os.path.join(self.folder, file_name)
+        cached = self._load_pickle_cache(key, [])
+        if cached is not None:
+            data = self._merge_columns(cached, data)
 
-        serialized = pickle.dumps(region_data)
+        serialized = pickle.dumps(data)
         compressed = gzip.compress(serialized)
 
         with open(file_path, "wb") as f:
             f.write(compressed)
 
+    def _get_column_cache_file_path(self, key, header_name):
+        """
+        Inserts the column name before the extension,
+        e.g. data_OLK.datagis-2019.npy -> data_OLK.datagis-2019.p1.npy
+        """
+        file_path = self._get_cache_file_path(key)
+        return file_path[:-len(".npy")] + F".{header_name}.npy"
+
+    def _load_columnar_cache(self, key, column_indices):
+        """
+        Memory-maps the files of the requested columns, nothing is read
+        until the data are accessed. Columns without a file are None.
+        """
+        data = [None] * len(self.headers)
+        for i in column_indices:
+            file_path = self._get_column_cache_file_path(key, self.headers[i][0])
+            if os.path.isfile(file_path):
+                data[i] = np.load(file_path, mmap_mode="r")
+
+        if all(column is None for column in data):
+            return None
+        return data
+
+    def _save_columnar_cache(self, key, data):
+        for header_name, column in zip(self.headers[..., 0], data):
+            if column is None:
+                continue
+            file_path = self._get_column_cache_file_path(key, header_name)
+            # Write to a temporary file first so that a partial file is never loaded
+            with open(file_path + ".tmp", "wb") as f:
+                np.save(f, column)
+            os.replace(file_path + ".tmp", file_path)
+
+
+def _parse_and_save_partitions(init_params, regions, file_paths, column_indices, filters):
+    """
+    Parses a group of regions in a worker process.
+    """
+    downloader = DataDownloader(**init_params)
+    # Codes of categories are local to this process, compact partitions are saved by the parent
+    partitions = downloader._parse_and_save_partitions(
+        regions, file_paths, column_indices, filters, save=not downloader.compact)
+    return partitions, downloader.categories
+
+
+# Formats of save_dataframe, ordered from the fastest to load
+DATAFRAME_EXTENSIONS = [".feather", ".parquet", ".pkl.gz"]
+
+
+def save_dataframe(df, file_path):
+    """
+    Saves the dataframe to a file, whose format is given by the extension:
+    .feather or .parquet, which need pyarrow, or .pkl.gz.
+    Parquet keeps only the categoricals of strings, the others are loaded
+    as their categories.
+    """
+    if file_path.endswith(".feather"):
+        df.to_feather(file_path)
+    elif file_path.endswith(".parquet"):
+        df.to_parquet(file_path)
+    elif file_path.endswith(".pkl.gz"):
+        df.to_pickle(file_path, compression="gzip")
+    else:
+        raise ValueError(F"Unsupported dataframe file: {file_path}")
+
+
+def load_dataframe(file_path):
+    """
+    Loads a dataframe saved by save_dataframe. If file_path has no
+    extension, the first existing file of the fastest formats is loaded,
+    e.g. accidents -> accidents.feather, accidents.parquet or accidents.pkl.gz.
+    """
+    if not file_path.endswith(tuple(DATAFRAME_EXTENSIONS)):
+        existing = [file_path + extension for extension in DATAFRAME_EXTENSIONS
+                    if os.path.isfile(file_path + extension)]
+        if len(existing) == 0:
+            raise FileNotFoundError(F"No dataframe file found: {file_path}")
+        file_path = existing[0]
+
+    if file_path.endswith(".feather"):
+        return pd.read_feather(file_path)
+    if file_path.endswith(".parquet"):
+        return pd.read_parquet(file_path)
+    return pd.read_pickle(file_path, compression="gzip")
+
 
 def print_unique(ar):
     u = np.sort(np.unique(ar))
@@ -462,3 +1739,6 @@ if __name__ == "__main__":
     # h, f = downloader.parse_region_data("ULK")
     # header_index = np.argwhere(downloader.headers[...,0] == "region").flatten()[0]
     # print_unique(f[header_index])
+
+    # Use the following line to save the dataframe loaded by analysis.py, geo.py and doc.py
+    # save_dataframe(downloader.get_dataframe(), "accidents.feather")
@@ -0,0 +1,156 @@
+"""
+
+@author: Ladislav Ondris
+         xondri07@vutbr.cz
+
+Encoders of integer code columns of PCR dataset to labelled categories.
+Each encoder holds a dense lookup table from codes to categories built once,
+so a whole column is encoded by a single numpy take instead of pd.cut.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class CodeEncoder:
+    """
+    Maps integer codes to categories with a dense lookup table
+    covering the codes from offset to offset + len(table) - 1.
+    Codes outside of the table are clipped to its ends, which either
+    belong to an unbounded bin or map to no category.
+    """
+
+    def __init__(self, table: np.ndarray, offset: int, labels: list, ordered: bool):
+        self.table = table
+        self.offset = offset
+        self.labels = labels
+        self.ordered = ordered
+
+    @classmethod
+    def from_bins(cls, bins: list, labels: list):
+        """
+        Creates an encoder of right-closed bins, as pd.cut does.
+        Finite edges of the bins must be integers, the first and the last
+        edge may be infinite.
+        """
+        edges = np.asarray(bins, dtype=np.float64)
+        finite = edges[np.isfinite(edges)]
+        # Just above the first and last finite edges, the first one
+        # is in the first bin only if it is unbounded, the last one likewise
+        low, high = int(finite[0]), int(finite[-1]) + 1
+        codes = np.arange(low, high + 1)
+        table = np.searchsorted(edges, codes, side='left') - 1
+        table[(table < 0) | (table >= len(labels))] = -1
+        return cls(table.astype(np.int8), low, list(labels), ordered=True)
+
+    @classmethod
+    def from_mapping(cls, mapping: dict):
+        """
+        Creates an encoder of the codes in the mapping to their labels,
+        other codes map to no category.
+        """
+        labels = list(dict.fromkeys(mapping.values()))
+        low, high = min(mapping) - 1, max(mapping) + 1
+        table = np.full(high - low + 1, -1, dtype=np.int8)
+        for code, label in mapping.items():
+            table[code - low] = labels.index(label)
+        return cls(table, low, labels, ordered=False)
+
+    def encode_codes(self, values) -> np.ndarray:
+        """
+        Returns the category index of each value, -1 for values
+        without a category including missing values.
+        """
+        if isinstance(values, pd.Series) and isinstance(values.dtype, pd.CategoricalDtype):
+            # Only the categories are looked up, -1 of missing values takes the appended -1
+            category_codes = np.append(self.encode_codes(values.cat.categories.to_numpy()), -1)
+            return category_codes[values.cat.codes.to_numpy()]
+        values = np.asarray(values)
+        missing = None
+        if values.dtype.kind == 'f':
+            missing = np.isnan(values)
+            # Right-closed bins of integer edges contain a value iff they contain its ceiling
+            values = np.ceil(np.where(missing, self.offset, values))
+        indices = np.clip(values, self.offset, self.offset + len(self.table) - 1).astype(np.intp)
+        codes = self.table[indices - self.offset]
+        if missing is not None:
+            codes[missing] = -1
+        return codes
+
+    def encode(self, col: pd.Series) -> pd.Series:
+        """
+        Encodes the column to a categorical column with the same index.
+        """
+        categorical = pd.Categorical.from_codes(self.encode_codes(col), categories=self.labels,
+                                                ordered=self.ordered)
+        return pd.Series(categorical, index=col.index, name=col.name)
+
+
+CAUSES = CodeEncoder.from_bins(
+    [99, 199, 299, 399, 499, 599, 699],
+    ['Nezaviněná řidičem', 'Nepřiměřená rychlost jízdy', 'Nesprávné předjíždění',
+     'Nedání přednosti v jízdě', 'Nesprávný způsob jízdy', 'Technická závada vozidla'])
+
+DAMAGES = CodeEncoder.from_bins(
+    [-np.inf, 500, 2000, 5000, 10000, np.inf],
+    ['<50', '50 - 200', '200 - 500', '500 - 1000', '>1000'])
+
+SURFACE_LABELS = {0: 'jiný stav',
+                  1: 'suchý neznečištěný',
+                  2: 'suchý znečištěný',
+                  3: 'mokrý',
+                  4: 'bláto',
+                  5: 'náledí, ujetý sníh - posypané',
+                  6: 'náledí, ujetý sníh - neposypané',
+                  7: 'rozlitý olej, nafta apod.',
+                  8: 'souvislý sníh',
+                  9: 'náhlá změna stavu'}
+
+ROAD_TYPE_LABELS = {0: 'dálnice',
+                    1: 'silnice 1. třídy',
+                    2: 'silnice 2. třídy',
+                    3: 'silnice 3. třídy',
+                    4: 'křižovatky ve městech',
+                    5: 'komunikace sledovaná',
+                    6: 'komunikace místní',
+                    7: 'účelová - polní a lesní cesty apod.',
+                    8: 'účelová - parkoviště, odpočívky apod.'}
+
+CONCRETE_CAUSE_LABELS = {100: "",
+                         204: "nepřizpůsobení rychlosti stavu vozovky",
+                         401: "semaforu",
+                         403: "proti příkazu dopravní značky",
+                         405: "při odbočování vlevo",
+                         411: "přejíždění do jiného pruhu",
+                         502: "vyhýbání bez dostatečného bočního odstupu",
+                         503: "nedodržení bezpečné vzdálenosti za vozidlem",
+                         504: "nesprávné otáčení nebo couvání",
+                         508: "řidič se plně nevěnoval řízení vozidla",
+                         511: "nezvládnutí řízení vozidla",
+                         516: "jiný druh nesprávného způsobu jízdy"}
+CONCRETE_CAUSES = CodeEncoder.from_mapping(CONCRETE_CAUSE_LABELS)
+
+# Encoded column read by the figures: the code column and its encoder
+ENCODED_COLUMNS = {'cause': ('p12', CAUSES),
+                   'damage': ('p53', DAMAGES)}
+
+
+def add_encoded_columns(df: pd.DataFrame):
+    """
+    Adds the categorical columns of ENCODED_COLUMNS whose code column
+    is present in df, so that they are encoded only once for the dataset.
+    """
+    for name, (column, encoder) in ENCODED_COLUMNS.items():
+        if column in df.columns:
+            df[name] = encoder.encode(df[column]).rename(name)
+
+
+def get_encoded(df: pd.DataFrame, name: str) -> pd.Series:
+    """
+    Returns the encoded column of ENCODED_COLUMNS, either the one
+    added by add_encoded_columns or encoded from its code column.
+    """
+    if name in df.columns:
+        return df[name]
+    column, encoder = ENCODED_COLUMNS[name]
+    return encoder.encode(df[column]).rename(name)
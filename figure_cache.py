@@ -0,0 +1,167 @@
+"""
+
+@author: Ladislav Ondris
+         xondri07@vutbr.cz
+
+Skips rendering of figures whose saved file is up to date.
+A figure is identified by the source code of its plot function,
+its parameters and a hash of the columns of the input data it reads.
+The keys are kept in figure_cache.json next to the figures.
+"""
+
+import functools
+import hashlib
+import inspect
+import json
+import os
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+
+
+class FigureCache:
+    """
+    Keeps the keys of saved figures and counts hits and misses.
+    """
+
+    index_filename = "figure_cache.json"
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    def get_key(self, plot, data, columns, params):
+        """
+        Returns the key of the figure or None if the data cannot be hashed,
+        e.g. if it is an iterator, which would be consumed.
+        """
+        data_hash = _hash_data(data, columns)
+        if data_hash is None:
+            return None
+        try:
+            source = inspect.getsource(plot)
+        except (OSError, TypeError):
+            source = plot.__qualname__
+        key = hashlib.sha256()
+        key.update(F"{plot.__module__}.{plot.__qualname__}".encode())
+        key.update(source.encode())
+        key.update(repr(sorted(params.items())).encode())
+        key.update(data_hash)
+        return key.hexdigest()
+
+    def is_fresh(self, fig_location, key):
+        """
+        Checks whether the figure exists and was saved with the given key.
+        """
+        if not os.path.exists(fig_location):
+            return False
+        entry = self._load_index(fig_location).get(os.path.basename(fig_location))
+        return entry is not None and entry["key"] == key and \
+            entry["mtime"] == os.stat(fig_location).st_mtime_ns
+
+    def save_key(self, fig_location, key):
+        """
+        Stores the key of a newly saved figure.
+        """
+        if not os.path.exists(fig_location):
+            return
+        index = self._load_index(fig_location)
+        index[os.path.basename(fig_location)] = {"key": key,
+                                                 "mtime": os.stat(fig_location).st_mtime_ns}
+        with open(self._get_index_path(fig_location), "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=2)
+
+    def _load_index(self, fig_location):
+        index_path = self._get_index_path(fig_location)
+        if not os.path.exists(index_path):
+            return {}
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except ValueError:
+            return {}
+
+    def _get_index_path(self, fig_location):
+        return os.path.join(os.path.dirname(fig_location), self.index_filename)
+
+
+figure_cache = FigureCache()
+
+
+def cached_figure(columns):
+    """
+    Decorates a plot function taking (data, fig_location, show_figure, ...)
+    so that it does not render the figure again if the file at fig_location
+    was saved from the same data columns and other arguments.
+    A figure that is only shown, not saved, is always rendered.
+    """
+    def decorator(plot):
+        signature = inspect.signature(plot)
+        data_name, location_name, show_name = list(signature.parameters)[:3]
+
+        @functools.wraps(plot)
+        def wrapper(*args, **kwargs):
+            arguments = signature.bind(*args, **kwargs)
+            arguments.apply_defaults()
+            params = dict(arguments.arguments)
+            data = params.pop(data_name)
+            fig_location = params.pop(location_name)
+            show_figure = params.pop(show_name)
+
+            key = None
+            if figure_cache.enabled and fig_location:
+                key = figure_cache.get_key(plot, data, columns, params)
+            if key is not None and figure_cache.is_fresh(fig_location, key):
+                if not show_figure or _show_saved_figure(fig_location):
+                    figure_cache.hits += 1
+                    return
+            if key is not None:
+                figure_cache.misses += 1
+            plot(*args, **kwargs)
+            if key is not None:
+                figure_cache.save_key(fig_location, key)
+        return wrapper
+    return decorator
+
+
+def _hash_data(data, columns):
+    """
+    Hashes the given columns of either a DataFrame or a tuple of headers
+    and features. Columns missing from the data are ignored.
+    Data with its own fingerprint, e.g. geo.GeoLayer, is hashed by it.
+    """
+    if hasattr(data, "fingerprint"):
+        return hashlib.sha256(data.fingerprint.encode()).digest()
+    if isinstance(data, pd.DataFrame):
+        present = [col for col in columns if col in data.columns]
+        values = [data[col] for col in present]
+    elif isinstance(data, tuple):
+        headers, features = data
+        present = [col for col in columns if col in headers]
+        values = [features[headers.index(col)] for col in present]
+    else:
+        return None
+    data_hash = hashlib.sha256(repr(present).encode())
+    for col in values:
+        if isinstance(col, pd.Series):
+            col_hash = pd.util.hash_pandas_object(col, index=False).to_numpy()
+        else:
+            col_hash = pd.util.hash_array(np.asarray(col))
+        data_hash.update(col_hash.tobytes())
+    return data_hash.digest()
+
+
+def _show_saved_figure(fig_location):
+    """
+    Shows a saved raster figure instead of rendering it again.
+    Returns False if the figure cannot be read back.
+    """
+    if os.path.splitext(fig_location)[1].lower() != ".png":
+        return False
+    image = plt.imread(fig_location)
+    dpi = plt.rcParams["figure.dpi"]
+    fig = plt.figure(figsize=(image.shape[1] / dpi, image.shape[0] / dpi), dpi=dpi)
+    fig.figimage(image)
+    fig.show()
+    return True
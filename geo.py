@@ -1,3 +1,7 @@
+import argparse
+import hashlib
+import os
+import pickle
 import numpy as np
 import pandas as pd
 import geopandas
@@ -5,8 +9,11 @@ import contextily as ctx
 import matplotlib.pyplot as plt
 import matplotlib.cm as cm
 import matplotlib.colors as colors
-from sklearn.cluster import KMeans
+from rasterio.warp import transform_bounds
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from mpl_toolkits.axes_grid1.inset_locator import inset_axes
+from download import load_dataframe
+from figure_cache import cached_figure, figure_cache
 
 
 def _save_show_fig(fig, fig_location, show_figure):
@@ -16,6 +23,288 @@ def _save_show_fig(fig, fig_location, show_figure):
         fig.show()
 
 
+class GeoLayer:
+    """
+    Positions of accidents in EPSG:5514 grouped by region, each region with
+    a grid index. Accidents lying outside the bounds of their region are marked
+    as outliers once when the layer is built, so that they need not be
+    filtered for every figure.
+    """
+
+    crs = "EPSG:5514"
+    _fields = ["regions", "starts", "x", "y", "p5a", "year", "inlier", "cell", "bounds", "ncols"]
+
+    def __init__(self, regions, starts, x, y, p5a, year, inlier, cell, bounds, ncols,
+                 cell_size, fingerprint):
+        self.regions = regions
+        self.starts = starts
+        self.x = x
+        self.y = y
+        self.p5a = p5a
+        self.year = year
+        self.inlier = inlier
+        self.cell = cell
+        self.bounds = bounds
+        self.ncols = ncols
+        self.cell_size = cell_size
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def build(cls, df: pd.DataFrame, cell_size: float = 1000.0):
+        """
+        Builds the layer from the d, e, p5a and region columns of df.
+        Rows with a missing value are left out. The year of each accident
+        is taken from p2a, or is 0 if df has no such column.
+        """
+        columns = ['d', 'e', 'p5a', 'region']
+        df_clean = df[columns + ['p2a'] if 'p2a' in df.columns else columns]
+        df_clean = df_clean.dropna(how='any', subset=columns)
+        if 'p2a' in df_clean.columns:
+            year = pd.to_datetime(df_clean['p2a']).dt.year.fillna(0).to_numpy(dtype=np.int16)
+        else:
+            year = np.zeros(len(df_clean), dtype=np.int16)
+        regions, region_codes = np.unique(df_clean['region'].to_numpy(dtype=str), return_inverse=True)
+        x = df_clean['d'].to_numpy(dtype=np.float64)
+        y = df_clean['e'].to_numpy(dtype=np.float64)
+
+        bounds = np.empty((len(regions), 4))
+        ncols = np.empty(len(regions), dtype=np.int64)
+        inlier = np.empty(len(x), dtype=bool)
+        cell = np.empty(len(x), dtype=np.int64)
+        for i in range(len(regions)):
+            mask = region_codes == i
+            bounds[i] = _get_region_bounds(x[mask], y[mask])
+            xmin, ymin, xmax, ymax = bounds[i]
+            inlier[mask] = (xmin <= x[mask]) & (x[mask] <= xmax) & (ymin <= y[mask]) & (y[mask] <= ymax)
+            ncols[i] = int((xmax - xmin) // cell_size) + 1
+            nrows = int((ymax - ymin) // cell_size) + 1
+            cols, rows = _get_cells(x[mask], y[mask], bounds[i], cell_size, ncols[i], nrows)
+            cell[mask] = rows * ncols[i] + cols
+
+        order = np.lexsort((cell, region_codes))
+        starts = np.searchsorted(region_codes[order], np.arange(len(regions) + 1))
+        return cls(regions, starts, x[order], y[order],
+                   df_clean['p5a'].to_numpy(dtype=np.int8)[order], year[order], inlier[order], cell[order],
+                   bounds, ncols, cell_size, _get_fingerprint(df))
+
+    def save(self, path: str):
+        """ Saves the layer to a npz file. """
+        np.savez(path, cell_size=self.cell_size, fingerprint=self.fingerprint,
+                 **{field: getattr(self, field) for field in self._fields})
+
+    @classmethod
+    def load(cls, path: str):
+        """ Loads the layer saved by GeoLayer.save. """
+        with np.load(path) as data:
+            return cls(cell_size=float(data['cell_size']), fingerprint=str(data['fingerprint']),
+                       **{field: data[field] for field in cls._fields})
+
+    def points(self, region: str, p5a: int = None, inliers: bool = True, year: int = None):
+        """
+        Returns x and y coordinates of accidents in the region,
+        optionally only those of the given location type (p5a) or year.
+        """
+        start, end = self._get_region_range(region)
+        mask = np.ones(end - start, dtype=bool)
+        if inliers:
+            mask &= self.inlier[start:end]
+        if p5a is not None:
+            mask &= self.p5a[start:end] == p5a
+        if year is not None:
+            mask &= self.year[start:end] == year
+        return self.x[start:end][mask], self.y[start:end][mask]
+
+    def query_bbox(self, xmin: float, ymin: float, xmax: float, ymax: float,
+                   region: str = None, inliers: bool = True) -> np.ndarray:
+        """
+        Returns indices into the arrays of the layer, e.g. layer.x,
+        of accidents within the bounding box, optionally only in the region.
+        """
+        region_ids = range(len(self.regions)) if region is None else [self._get_region_id(region)]
+        indices = []
+        for i in region_ids:
+            start, end = self.starts[i], self.starts[i + 1]
+            nrows = int((self.bounds[i, 3] - self.bounds[i, 1]) // self.cell_size) + 1
+            # Outliers are clipped to the border cells, so the cell range is clipped too
+            cols, rows = _get_cells(np.array([xmin, xmax]), np.array([ymin, ymax]), self.bounds[i],
+                                    self.cell_size, self.ncols[i], nrows)
+            row_cells = np.arange(rows[0], rows[1] + 1) * self.ncols[i]
+            cell_starts = np.searchsorted(self.cell[start:end], row_cells + cols[0], side='left')
+            cell_ends = np.searchsorted(self.cell[start:end], row_cells + cols[1], side='right')
+            for cell_start, cell_end in zip(cell_starts, cell_ends):
+                indices.append(np.arange(start + cell_start, start + cell_end))
+        if not indices:
+            return np.empty(0, dtype=np.int64)
+        indices = np.concatenate(indices)
+        x, y = self.x[indices], self.y[indices]
+        mask = (xmin <= x) & (x <= xmax) & (ymin <= y) & (y <= ymax)
+        if inliers:
+            mask &= self.inlier[indices]
+        return indices[mask]
+
+    def query_radius(self, x: float, y: float, radius: float,
+                     region: str = None, inliers: bool = True) -> np.ndarray:
+        """
+        Returns indices into the arrays of the layer of accidents
+        at most radius meters from the point, optionally only in the region.
+        """
+        indices = self.query_bbox(x - radius, y - radius, x + radius, y + radius, region, inliers)
+        distances = (self.x[indices] - x) ** 2 + (self.y[indices] - y) ** 2
+        return indices[distances <= radius ** 2]
+
+    def years(self, region: str) -> np.ndarray:
+        """ Returns the sorted years of accidents in the region. """
+        start, end = self._get_region_range(region)
+        return np.unique(self.year[start:end])
+
+    def _get_region_id(self, region):
+        region_id = np.searchsorted(self.regions, region)
+        if region_id == len(self.regions) or self.regions[region_id] != region:
+            raise ValueError(F"Unknown region: {region}")
+        return region_id
+
+    def _get_region_range(self, region):
+        region_id = self._get_region_id(region)
+        return self.starts[region_id], self.starts[region_id + 1]
+
+
+def _get_region_bounds(x, y, quantile=0.005, margin=0.5):
+    """
+    Returns the bounds (xmin, ymin, xmax, ymax) of a region estimated
+    from the positions of its accidents. Extreme quantiles are left out
+    and the remaining extent is enlarged by the margin on each side.
+    """
+    if len(x) == 0:
+        return 0.0, 0.0, 0.0, 0.0
+    xmin, xmax = np.quantile(x, [quantile, 1 - quantile])
+    ymin, ymax = np.quantile(y, [quantile, 1 - quantile])
+    xmargin, ymargin = (xmax - xmin) * margin, (ymax - ymin) * margin
+    return xmin - xmargin, ymin - ymargin, xmax + xmargin, ymax + ymargin
+
+
+def _get_cells(x, y, bounds, cell_size, ncols, nrows):
+    """ Returns the grid columns and rows of the points clipped to the grid. """
+    cols = np.clip((x - bounds[0]) // cell_size, 0, ncols - 1).astype(np.int64)
+    rows = np.clip((y - bounds[1]) // cell_size, 0, nrows - 1).astype(np.int64)
+    return cols, rows
+
+
+def _get_fingerprint(df):
+    """ Hashes the columns the layer is built from. """
+    data_hash = hashlib.sha256()
+    for col in ['d', 'e', 'p5a', 'region', 'p2a']:
+        if col not in df.columns:
+            continue
+        data_hash.update(pd.util.hash_pandas_object(df[col], index=False).to_numpy().tobytes())
+    return data_hash.hexdigest()
+
+
+def load_geo_layer(df: pd.DataFrame, path: str = "geo_layer.npz") -> GeoLayer:
+    """
+    Loads the layer saved at path if it was built from the same data as df,
+    otherwise builds it and saves it.
+    """
+    if os.path.exists(path):
+        try:
+            layer = GeoLayer.load(path)
+        except KeyError:
+            # Saved by a version with other fields
+            layer = None
+        if layer is not None and layer.fingerprint == _get_fingerprint(df):
+            return layer
+    layer = GeoLayer.build(df)
+    layer.save(path)
+    return layer
+
+
+def _as_layer(data) -> GeoLayer:
+    if isinstance(data, GeoLayer):
+        return data
+    return GeoLayer.build(data)
+
+
+class BasemapTiles:
+    """
+    Local store of basemaps, one GeoTIFF in Web Mercator for each region,
+    seeded once from the tile source, so that figures need no network.
+    Offline, a figure of a region that was not seeded fails immediately
+    instead of waiting for the tile server.
+    The source is a contextily tile provider or its name, e.g. "CartoDB.Positron",
+    which is the default.
+    """
+
+    def __init__(self, folder: str = "tiles", source=None,
+                 offline: bool = False, padding: float = 0.1):
+        self.folder = folder
+        self.source = source
+        self.offline = offline
+        self.padding = padding
+
+    def seed(self, layer: GeoLayer, regions: list = None, zoom='auto', overwrite: bool = False):
+        """
+        Downloads the basemaps of the regions, all of the layer by default.
+        The extent of each region is its bounds enlarged by the padding
+        on each side, to cover the margins of the axes too.
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        if regions is None:
+            regions = layer.regions
+        for region in regions:
+            path = self.get_path(region)
+            if os.path.exists(path) and not overwrite:
+                continue
+            xmin, ymin, xmax, ymax = layer.bounds[layer._get_region_id(region)]
+            xpadding, ypadding = (xmax - xmin) * self.padding, (ymax - ymin) * self.padding
+            west, south, east, north = transform_bounds(layer.crs, "EPSG:3857",
+                                                        xmin - xpadding, ymin - ypadding,
+                                                        xmax + xpadding, ymax + ypadding)
+            # Written to a temporary file, so that an interrupted download is not used
+            ctx.bounds2raster(west, south, east, north, path + ".part", zoom=zoom,
+                              source=self._get_source(), ll=False)
+            os.replace(path + ".part", path)
+
+    def get_path(self, region: str) -> str:
+        return os.path.join(self.folder, F"{region}.tif")
+
+    def _get_source(self):
+        if self.source is None:
+            return ctx.providers.CartoDB.Positron
+        if isinstance(self.source, str):
+            return ctx.providers.query_name(self.source)
+        return self.source
+
+    def add_basemap(self, axes, crs: str, region: str):
+        """
+        Adds the basemap of the region to all the axes, which are set
+        to the same extent, so that the basemap is loaded only once.
+        """
+        axes = np.ravel(axes)
+        xmin = min(ax.get_xlim()[0] for ax in axes)
+        xmax = max(ax.get_xlim()[1] for ax in axes)
+        ymin = min(ax.get_ylim()[0] for ax in axes)
+        ymax = max(ax.get_ylim()[1] for ax in axes)
+        for ax in axes:
+            ax.axis((xmin, xmax, ymin, ymax))
+
+        source = self.get_path(region)
+        if not os.path.exists(source):
+            if self.offline:
+                raise FileNotFoundError(F"Basemap of region {region} is not seeded in {self.folder}")
+            # Tiles fetched from the network are kept for the next figures
+            ctx.set_cache_dir(os.path.join(self.folder, "cache"))
+            source = self._get_source()
+
+        ctx.add_basemap(axes[0], crs=crs, source=source)
+        image = axes[0].images[-1]
+        for ax in axes[1:]:
+            ax.imshow(image.get_array(), extent=image.get_extent(),
+                      interpolation=image.get_interpolation(), aspect=ax.get_aspect())
+            ax.axis((xmin, xmax, ymin, ymax))
+
+
+basemap_tiles = BasemapTiles()
+
+
 def make_geo(df: pd.DataFrame) -> geopandas.GeoDataFrame:
     """d, e = pozice"""
     """p5a = lokalita (1 - v obci, 2 - mimo obec)"""
@@ -26,13 +315,17 @@ def make_geo(df: pd.DataFrame) -> geopandas.GeoDataFrame:
     return gdf
 
 
-def plot_geo(gdf: geopandas.GeoDataFrame, fig_location: str = None, show_figure: bool = False):
-    # Prepare data
-    gdf_olk = gdf[gdf['region'] == 'OLK']
-    gdf_olk_in = gdf_olk[gdf_olk['p5a'] == 1]
-    gdf_olk_out = gdf_olk[gdf_olk['p5a'] == 2]
-    # remove outlier that's outside the region
-    gdf_olk_out = gdf_olk_out[gdf_olk_out['d'] < -490000.0]
+@cached_figure(columns=['d', 'e', 'p5a', 'region'])
+def plot_geo(data, fig_location: str = None, show_figure: bool = False, mode: str = 'points'):
+    """
+    Plots accidents in OLK region in and outside of towns.
+    The data is either a GeoLayer or a DataFrame with d, e, p5a and region columns.
+    The mode is one of PLOT_MODES, see _plot_accidents.
+    """
+    # Prepare data, outliers outside the region are left out
+    layer = _as_layer(data)
+    x_in, y_in = layer.points('OLK', p5a=1)
+    x_out, y_out = layer.points('OLK', p5a=2)
 
     # Setup figure
     fig, ax = plt.subplots(1, 2, figsize=(20, 16))
@@ -46,12 +339,11 @@ def plot_geo(gdf: geopandas.GeoDataFrame, fig_location: str = None, show_figure:
     ax[1].set_title('Nehody v OLK kraji: mimo obec', fontsize=24)
 
     # Plot accidents
-    gdf_olk_in.centroid.plot(ax=ax[0], markersize=5, color='#d92c26')
-    gdf_olk_out.centroid.plot(ax=ax[1], markersize=5, color='#2b2f35')
+    _plot_accidents(ax[0], x_in, y_in, '#d92c26', mode)
+    _plot_accidents(ax[1], x_out, y_out, '#2b2f35', mode)
 
     # Add background map
-    ctx.add_basemap(ax[0], crs=gdf_olk.crs.to_string(), source=ctx.providers.Stamen.TonerLite)
-    ctx.add_basemap(ax[1], crs=gdf_olk.crs.to_string(), source=ctx.providers.Stamen.TonerLite)
+    basemap_tiles.add_basemap(ax, layer.crs, 'OLK')
 
     # Plot figure
     fig.tight_layout()
@@ -59,6 +351,52 @@ def plot_geo(gdf: geopandas.GeoDataFrame, fig_location: str = None, show_figure:
     _save_show_fig(fig, fig_location, show_figure)
 
 
+PLOT_MODES = ['points', 'hexbin', 'raster']
+
+
+def _plot_accidents(ax, x, y, color, mode='points', cell_size=500.0):
+    """
+    Plots accidents either as points, or as their density in hexagons
+    or in a raster of square cells of cell_size meters. The size of the density
+    plots does not grow with the number of accidents, unlike the points.
+    """
+    if mode not in PLOT_MODES:
+        raise ValueError(F"Unknown plot mode: {mode}, use one of {PLOT_MODES}")
+    if len(x) == 0:
+        return
+    if mode == 'points':
+        ax.scatter(x, y, s=5, color=color)
+    elif mode == 'hexbin':
+        gridsize = max(int((x.max() - x.min()) // cell_size), 1)
+        ax.hexbin(x, y, gridsize=gridsize, mincnt=1, bins='log', cmap=_density_cmap(color))
+    else:
+        counts, extent = rasterize(x, y, cell_size)
+        # Above the basemap, which is added later with the same zorder otherwise
+        ax.imshow(np.ma.masked_equal(counts, 0), extent=extent, origin='lower',
+                  cmap=_density_cmap(color), norm=colors.LogNorm(), interpolation='nearest', zorder=1)
+
+
+def rasterize(x: np.ndarray, y: np.ndarray, cell_size: float):
+    """
+    Counts the points in square cells of a grid aligned to cell_size.
+    Returns the counts with rows along y and the extent
+    (xmin, xmax, ymin, ymax) of the grid for imshow.
+    """
+    xmin = np.floor(x.min() / cell_size) * cell_size
+    ymin = np.floor(y.min() / cell_size) * cell_size
+    cols = ((x - xmin) // cell_size).astype(np.int64)
+    rows = ((y - ymin) // cell_size).astype(np.int64)
+    ncols, nrows = cols.max() + 1, rows.max() + 1
+    counts = np.bincount(rows * ncols + cols, minlength=nrows * ncols).reshape(nrows, ncols)
+    return counts, (xmin, xmin + ncols * cell_size, ymin, ymin + nrows * cell_size)
+
+
+def _density_cmap(color):
+    """ Create a cmap from a transparent to an opaque color. """
+    return colors.LinearSegmentedColormap.from_list(
+        F"density({color})", [colors.to_rgba(color, 0.25), colors.to_rgba(color, 1.0)])
+
+
 def _cmap_subset(cmap, min, max):
     """ Create a subset of a cmap. """
     return colors.LinearSegmentedColormap.from_list(
@@ -66,17 +404,208 @@ def _cmap_subset(cmap, min, max):
         cmap(np.linspace(min, max, 256)))
 
 
-def plot_cluster(gdf: geopandas.GeoDataFrame, fig_location: str = None,
-                 show_figure: bool = False):
-    gdf_olk = gdf[gdf['region'] == 'OLK']
-    # remove outlier that's outside the region
-    gdf_olk = gdf_olk[gdf_olk['d'] < -490000.0]
+CLUSTER_METHODS = ['kmeans', 'minibatch', 'grid']
+
+
+class ClusterModel:
+    """
+    Clusters accident positions either with mini-batch k-means,
+    or by binning them into a grid whose densest cells become the clusters.
+    The points are processed in batches, so the memory does not grow
+    with their number, and the model can be updated with new partitions
+    of accidents, e.g. of another year, without fitting the old ones again.
+    """
+
+    def __init__(self, method: str = 'minibatch', n_clusters: int = 20,
+                 cell_size: float = 2000.0, batch_size: int = 65536):
+        if method not in ['minibatch', 'grid']:
+            raise ValueError(F"Unknown incremental clustering method: {method}")
+        self.method = method
+        self.n_clusters = n_clusters
+        self.cell_size = cell_size
+        self.batch_size = batch_size
+        # Hash of the positions of each partition the model was updated with
+        self.partitions = {}
+        self._kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=0, n_init=3)
+        # Number of accidents and sums of their positions for each occupied grid cell
+        self.counts = np.empty(0, dtype=np.int64)
+        self._cells = np.empty(0, dtype=np.int64)
+        self._cell_sums = np.empty((0, 2))
+
+    @property
+    def centers(self) -> np.ndarray:
+        """ Centers of the clusters, one row (x, y) for each cluster. """
+        if self.method == 'minibatch':
+            return self._kmeans.cluster_centers_
+        return self._cell_sums / self.counts[:, np.newaxis]
+
+    def update(self, x: np.ndarray, y: np.ndarray):
+        """ Adds accidents at the given positions to the clusters. """
+        if len(x) == 0:
+            return
+        if self.method == 'minibatch':
+            self._update_kmeans(x, y)
+        else:
+            self._update_grid(x, y)
+
+    def update_partitions(self, partitions: dict) -> bool:
+        """
+        Updates the model with those of the partitions, a dict of partition keys
+        to their x and y positions, it was not updated with yet.
+        Returns False without updating if a partition it was updated with
+        has changed or is missing, the model must then be fitted again.
+        """
+        hashes = {key: _hash_positions(x, y) for key, (x, y) in partitions.items()}
+        if any(hashes.get(key) != value for key, value in self.partitions.items()):
+            return False
+        for key, (x, y) in partitions.items():
+            if key not in self.partitions:
+                self.update(x, y)
+                self.partitions[key] = hashes[key]
+        return True
+
+    def get_clusters(self, x: np.ndarray = None, y: np.ndarray = None):
+        """
+        Returns the centers of the clusters and the number of accidents in them.
+        Mini-batch k-means counts the given accidents by the final centers,
+        so x and y are required. Grid clustering returns the n_clusters densest
+        cells with all the accidents it was updated with.
+        """
+        if self.method == 'minibatch':
+            if x is None or y is None:
+                raise ValueError("Mini-batch clusters require the positions to count")
+            return self.centers, self._count_kmeans(x, y)
+        densest = np.argsort(self.counts, kind='stable')[::-1][:self.n_clusters]
+        return self.centers[densest], self.counts[densest]
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            pickle.dump(self, f)
+
+    @staticmethod
+    def load(path: str):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def _update_kmeans(self, x, y):
+        # The first batch must not have fewer points than clusters
+        batch_size = max(self.batch_size, self.n_clusters)
+        # Points of GeoLayer are sorted by position, so each batch takes every
+        # n-th point to spread over the whole area instead of a part of it
+        n_batches = max(len(x) // batch_size, 1)
+        for i in range(n_batches):
+            self._kmeans.partial_fit(np.column_stack((x[i::n_batches], y[i::n_batches])))
+
+    def _count_kmeans(self, x, y):
+        # Counted only after all the updates, so that all points use the final centers
+        counts = np.zeros(self.n_clusters, dtype=np.int64)
+        for start in range(0, len(x), self.batch_size):
+            labels = self._kmeans.predict(np.column_stack((x[start:start + self.batch_size],
+                                                           y[start:start + self.batch_size])))
+            counts += np.bincount(labels, minlength=self.n_clusters)
+        return counts
+
+    def _update_grid(self, x, y):
+        for start in range(0, len(x), self.batch_size):
+            batch_x, batch_y = x[start:start + self.batch_size], y[start:start + self.batch_size]
+            cols = (batch_x // self.cell_size).astype(np.int64)
+            rows = (batch_y // self.cell_size).astype(np.int64)
+            cells = (cols << 32) + (rows & 0xFFFFFFFF)
+            all_cells = np.concatenate((self._cells, cells))
+            all_x = np.concatenate((self._cell_sums[:, 0], batch_x))
+            all_y = np.concatenate((self._cell_sums[:, 1], batch_y))
+            all_counts = np.concatenate((self.counts, np.ones(len(cells), dtype=np.int64)))
+            self._cells, inverse = np.unique(all_cells, return_inverse=True)
+            self.counts = np.bincount(inverse, weights=all_counts).astype(np.int64)
+            self._cell_sums = np.column_stack((np.bincount(inverse, weights=all_x),
+                                               np.bincount(inverse, weights=all_y)))
+
+
+def get_clusters(layer: GeoLayer, region: str, method: str = 'kmeans', n_clusters: int = 20,
+                 cache_folder: str = "cluster_cache"):
+    """
+    Returns the centers of clusters of the accidents in the region, outliers
+    left out, and the number of accidents in each of them.
+    kmeans is fitted at once and its result is cached in the cache_folder
+    by a hash of the positions. minibatch and grid models are persisted
+    in the cache_folder for each region, method and n_clusters, and are updated
+    only with the years of accidents they have not seen yet.
+    A cache_folder of None disables the cache.
+    """
+    if method not in CLUSTER_METHODS:
+        raise ValueError(F"Unknown clustering method: {method}, use one of {CLUSTER_METHODS}")
+    x, y = layer.points(region)
+    if method != 'kmeans':
+        return _update_cluster_model(layer, region, method, n_clusters, cache_folder) \
+            .get_clusters(x, y)
+
+    cache_path = None
+    if cache_folder:
+        key = hashlib.sha256(F"{method},{n_clusters}".encode())
+        key.update(_hash_positions(x, y).encode())
+        cache_path = os.path.join(cache_folder, F"clusters_{key.hexdigest()[:32]}.npz")
+        if os.path.exists(cache_path):
+            with np.load(cache_path) as cached:
+                return cached['centers'], cached['counts']
+
+    kmeans = KMeans(n_clusters=n_clusters, random_state=0)
+    kmeans.fit(np.column_stack((x, y)))
+    centers = kmeans.cluster_centers_
+    counts = np.bincount(kmeans.labels_, minlength=n_clusters)
+
+    if cache_path:
+        os.makedirs(cache_folder, exist_ok=True)
+        np.savez(cache_path, centers=centers, counts=counts)
+    return centers, counts
+
+
+def _update_cluster_model(layer, region, method, n_clusters, cache_folder):
+    """
+    Loads the persisted model of the region and updates it with the new years,
+    or fits a new one if an old year has changed.
+    """
+    partitions = {int(year): layer.points(region, year=year) for year in layer.years(region)}
+    model_path = None
+    model = None
+    if cache_folder:
+        model_path = os.path.join(cache_folder, F"{region}_{method}_{n_clusters}.pkl")
+        if os.path.exists(model_path):
+            model = ClusterModel.load(model_path)
+    if model is None or not model.update_partitions(partitions):
+        model = ClusterModel(method, n_clusters)
+        model.update_partitions(partitions)
+    if model_path:
+        os.makedirs(cache_folder, exist_ok=True)
+        model.save(model_path)
+    return model
+
+
+def _hash_positions(x, y):
+    # The order of the points in the layer depends on the grid of the region,
+    # which may move with new accidents, so the points are hashed in sorted order
+    order = np.lexsort((y, x))
+    positions_hash = hashlib.sha256(np.ascontiguousarray(x[order], dtype=np.float64).tobytes())
+    positions_hash.update(np.ascontiguousarray(y[order], dtype=np.float64).tobytes())
+    return positions_hash.hexdigest()
+
+
+@cached_figure(columns=['d', 'e', 'p5a', 'region'])
+def plot_cluster(data, fig_location: str = None, show_figure: bool = False,
+                 method: str = 'kmeans', n_clusters: int = 20, mode: str = 'points'):
+    """
+    Plots clusters of accidents in OLK region.
+    The data is either a GeoLayer or a DataFrame with d, e, p5a and region columns.
+    The method is one of CLUSTER_METHODS, kmeans fits all the accidents at once,
+    minibatch and grid scale to millions of accidents and are updated only
+    with new years, see get_clusters.
+    The mode of plotting the accidents is one of PLOT_MODES, see _plot_accidents.
+    """
+    # Outliers outside the region are left out
+    layer = _as_layer(data)
+    x, y = layer.points('OLK')
 
     # Find clusters
-    kmeans = KMeans(n_clusters=20, random_state=0)
-    kmeans.fit(gdf_olk[['d', 'e']])
-    cluster_centers = kmeans.cluster_centers_
-    cluster_indices, cluster_counts = np.unique(kmeans.labels_, return_counts=True)
+    cluster_centers, cluster_counts = get_clusters(layer, 'OLK', method, n_clusters)
     cluster_center_areas = cluster_counts * 1.2
 
     # Setup figure
@@ -88,7 +617,7 @@ def plot_cluster(gdf: geopandas.GeoDataFrame, fig_location: str = None,
     fig.suptitle("Nehody v Olomouckém kraji", fontsize=24, fontweight='bold')
 
     # Plot clusters
-    cmap = _cmap_subset(cm.get_cmap('Reds'), 0.4, 1.0)
+    cmap = _cmap_subset(plt.get_cmap('Reds'), 0.4, 1.0)
     ax.scatter(cluster_centers[:, 0], cluster_centers[:, 1], c=cluster_counts,
                cmap=cmap, s=cluster_center_areas, alpha=0.75)
 
@@ -103,9 +632,9 @@ def plot_cluster(gdf: geopandas.GeoDataFrame, fig_location: str = None,
     cbar.ax.tick_params(labelsize='large')
 
     # Plot accidents
-    gdf_olk.centroid.plot(ax=ax, markersize=5, color='#2b2f35')
+    _plot_accidents(ax, x, y, '#2b2f35', mode)
     # Add background map
-    ctx.add_basemap(ax, crs=gdf_olk.crs.to_string(), source=ctx.providers.Stamen.TonerLite)
+    basemap_tiles.add_basemap(ax, layer.crs, 'OLK')
 
     # Plot figure
     fig.subplots_adjust(top=0.95, left=0.02, right=0.98, bottom=0.02)
@@ -113,6 +642,20 @@ def plot_cluster(gdf: geopandas.GeoDataFrame, fig_location: str = None,
 
 
 if __name__ == "__main__":
-    gdf = make_geo(pd.read_pickle("accidents.pkl.gz"))
-    plot_cluster(gdf, "geo2.png", True)
-    plot_geo(gdf, "geo1.png", True)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seed_tiles', action='store_true', default=False,
+                        help='Download basemaps of all regions to the tiles folder')
+    parser.add_argument('--offline', action='store_true', default=False,
+                        help='Use only the basemaps in the tiles folder')
+    parser.add_argument('--source', type=str, default='CartoDB.Positron',
+                        help='Name of the contextily tile provider of the basemaps')
+    args = parser.parse_args()
+
+    layer = load_geo_layer(load_dataframe("accidents"))
+    basemap_tiles.source = args.source
+    basemap_tiles.offline = args.offline
+    if args.seed_tiles:
+        basemap_tiles.seed(layer)
+    plot_cluster(layer, "geo2.png", True)
+    plot_geo(layer, "geo1.png", True)
+    print(F"Figure cache: {figure_cache.hits} hits, {figure_cache.misses} misses")
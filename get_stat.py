@@ -7,9 +7,11 @@ This file plots data from PCR dataset.
 """
 
 import numpy as np
+import pandas as pd
 import argparse
 import matplotlib.pyplot as plt
 from download import DataDownloader
+from figure_cache import cached_figure, figure_cache
 
 
 def label_bars(ax, rects):
@@ -23,6 +25,7 @@ def label_bars(ax, rects):
                     ha='center', va='bottom', color='white')
 
 
+@cached_figure(columns=['region', 'p2a', 'year', 'count'])
 def plot_stat(data_source, fig_location=None, show_figure=False):
     """
     Given a data_source of parsed PCR dataset, it produces
@@ -32,7 +35,9 @@ def plot_stat(data_source, fig_location=None, show_figure=False):
     Parameters
     ----------
     data_source :
-        The data source.
+        The data source, either a tuple of headers and features,
+        an iterable of such tuples, e.g. DataDownloader.iter_chunks,
+        or a DataFrame of DataDownloader.get_aggregates by region and year.
     fig_location : string, optional
         File path to save the figure to. If it None, it is not saved.
     show_figure : boolean, optional
@@ -43,27 +48,27 @@ def plot_stat(data_source, fig_location=None, show_figure=False):
     None.
 
     """
-    headers, features = data_source
-    regions_col = _get_regions_col(headers, features)
-    years_col = _get_years_col(headers, features)
-
-    unique_years, year_indices = np.unique(years_col, return_inverse=True)
-    unique_regions = np.unique(regions_col)
-
-    fig, ax_list = plt.subplots(nrows=len(unique_years), ncols=1,
-                                figsize=(0.6*len(unique_regions), 2.5*len(unique_years)),
+    if isinstance(data_source, pd.DataFrame):
+        counts = _get_counts_for_each_year_and_region_from_aggregates(data_source)
+    else:
+        if isinstance(data_source, tuple):
+            data_source = [data_source]
+        counts = _get_counts_for_each_year_and_region_in_chunks(data_source)
+    year_labels, region_labels, counts = counts
+
+    fig, ax_list = plt.subplots(nrows=len(year_labels), ncols=1,
+                                figsize=(0.6*len(region_labels), 2.5*len(year_labels)),
                                 sharey=True)
 
-    counts = _get_counts_for_each_year_and_region(
-                    regions_col, unique_years, year_indices)
-
-    for i, (year, regions_counts) in enumerate(counts):
-        indexofsort_ascending = np.argsort(regions_counts[:, 1].astype(int), axis=-1)
-        indexofsort_descending = np.flip(indexofsort_ascending, axis=0)
-        regions_counts = regions_counts[indexofsort_descending, :]
+    for i, year in enumerate(year_labels):
+        # Only regions with an accident in the year are shown
+        present = np.flatnonzero(counts[i] > 0)
+        indexofsort_ascending = np.argsort(counts[i, present], axis=-1)
+        indexofsort_descending = present[np.flip(indexofsort_ascending, axis=0)]
 
         ax = ax_list[i]
-        bars = ax.bar(regions_counts[:, 0], regions_counts[:, 1].astype(int), width=0.97)
+        bars = ax.bar(region_labels[indexofsort_descending], counts[i, indexofsort_descending],
+                      width=0.97)
         ax.set_title(year, fontsize=14, y=0.83)
         ax.tick_params(axis="x", bottom=False)
         ax.tick_params(axis="y", left=False)
@@ -94,14 +99,80 @@ def _get_years_col(headers, features):
     return dates_col.astype("datetime64[Y]")
 
 
-def _get_counts_for_each_year_and_region(regions_col, unique_years, year_indices):
-    counts = []
-    for i, year in enumerate(unique_years):
-        regions_for_the_year = regions_col[np.argwhere(year_indices == i)]
-        region_labels, region_counts = np.unique(regions_for_the_year, return_counts=True)
-        regions_counts = np.stack([region_labels, region_counts], axis=1)
-        counts.append([year, regions_counts])
-    return counts
+def _get_counts_for_each_year_and_region_in_chunks(chunks):
+    """
+    Counts the accidents chunk by chunk, so that only running totals
+    and a single chunk are held in memory.
+    """
+    totals = (np.array([], dtype=str), np.array([], dtype=str), np.zeros((0, 0), dtype=np.int64))
+    for headers, features in chunks:
+        regions_col = _get_regions_col(headers, features)
+        years_col = _get_years_col(headers, features)
+        totals = _add_counts(totals, _get_counts_for_each_year_and_region(regions_col, years_col))
+    return totals
+
+
+def _add_counts(counts1, counts2):
+    """
+    Adds two count matrices, whose labels may differ.
+    """
+    year_labels = np.union1d(counts1[0], counts2[0])
+    region_labels = np.union1d(counts1[1], counts2[1])
+    counts = np.zeros((len(year_labels), len(region_labels)), dtype=np.int64)
+    for years, regions, matrix in [counts1, counts2]:
+        counts[np.ix_(np.searchsorted(year_labels, years),
+                      np.searchsorted(region_labels, regions))] += matrix
+    return year_labels, region_labels, counts
+
+
+def _get_counts_for_each_year_and_region_from_aggregates(aggregates):
+    """
+    Takes the counts from aggregates, which are already grouped by region and year.
+    """
+    years = aggregates['year'].map(lambda year: 'NaT' if pd.isna(year) else str(int(year)))
+    counts = pd.crosstab(years.to_numpy(), aggregates['region'].to_numpy(),
+                         values=aggregates['count'].to_numpy(), aggfunc='sum').fillna(0)
+    return (counts.index.to_numpy(dtype=str), counts.columns.to_numpy(dtype=str),
+            counts.to_numpy(dtype=np.int64))
+
+
+def _get_counts_for_each_year_and_region(regions_col, years_col):
+    """
+    Counts the accidents in each year and region in a single pass.
+    Returns labels of the years, sorted with NaT last, labels of the regions,
+    and a matrix of counts with a row for each year and a column for each region.
+    """
+    year_codes, years = pd.factorize(years_col, sort=True, use_na_sentinel=False)
+    region_codes, region_labels = _factorize_strings(regions_col)
+
+    counts = np.bincount(year_codes * len(region_labels) + region_codes,
+                         minlength=len(years) * len(region_labels))
+    counts = counts.reshape(len(years), len(region_labels))
+    return years.astype(str), region_labels, counts
+
+
+def _factorize_strings(col):
+    """
+    Returns codes of the strings and the sorted unique strings.
+    Strings of up to three characters, such as regions, are packed
+    into integers first, which are much faster to factorize.
+    """
+    if col.dtype.kind != "U" or col.dtype.itemsize > 12:
+        codes, labels = pd.factorize(col, sort=True, use_na_sentinel=False)
+        return codes, np.asarray(labels).astype(str)
+
+    # Each character is 21 bits at most, the packed integers sort as the strings
+    chars = np.ascontiguousarray(col).view(np.uint32).reshape(len(col), col.dtype.itemsize // 4)
+    keys = np.zeros(len(col), dtype=np.int64)
+    for i in range(chars.shape[1]):
+        keys = (keys << 21) | chars[:, i]
+    codes, unique_keys = pd.factorize(keys, sort=True)
+
+    labels = []
+    for key in unique_keys:
+        label = "".join(chr((key >> (21 * i)) & 0x1FFFFF) for i in reversed(range(chars.shape[1])))
+        labels.append(label.rstrip("\0"))
+    return codes, np.array(labels, dtype=col.dtype)
 
 
 if __name__ == "__main__":
@@ -112,5 +183,6 @@ if __name__ == "__main__":
                         action='store_true', default=False)
     args = parser.parse_args()
 
-    data_source = DataDownloader().get_list()
+    data_source = DataDownloader().get_aggregates(by=["region", "year"])
     plot_stat(data_source, show_figure=args.show_figure, fig_location=args.fig_location)
+    print(F"Figure cache: {figure_cache.hits} hits, {figure_cache.misses} misses")
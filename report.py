@@ -0,0 +1,154 @@
+"""
+
+@author: Ladislav Ondris
+         xondri07@vutbr.cz
+
+Renders all figures of the analysis at once. The dataframe is loaded
+only once, each figure receives only the columns it needs,
+and the figures are rendered in parallel processes without a display.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import time
+import traceback
+import matplotlib
+# Must be selected before pyplot is imported, also by the worker processes
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from download import load_dataframe
+
+
+def _prepare_surface(df):
+    analysis = importlib.import_module("analysis")
+    analysis.add_date_column(df)
+    return df
+
+
+def _prepare_stat(df):
+    return ["region", "p2a"], [df["region"].to_numpy(dtype=str), df["p2a"].to_numpy()]
+
+
+# Figure name: module, plot function, needed columns or None for the geo layer,
+# preparation of the input
+FIGURES = {
+    "01_nasledky": ("analysis", "plot_conseq", ["p13a", "p13b", "p13c", "region"], None),
+    "02_priciny": ("analysis", "plot_damage", ["region", "p53", "p12"], None),
+    "03_stav": ("analysis", "plot_surface", ["region", "p2a", "p16", "p1"], _prepare_surface),
+    "04_typ_komunikace": ("doc", "plot_time_roadtype", ["p1", "p2a", "p2b", "p36"], None),
+    "05_priciny": ("doc", "plot_main_causes", ["p1", "p36", "p12"], None),
+    "geo1": ("geo", "plot_geo", None, None),
+    "geo2": ("geo", "plot_cluster", None, None),
+    "stat": ("get_stat", "plot_stat", ["region", "p2a"], _prepare_stat),
+}
+
+
+def build_report(data, output, formats=("png",), figures=None, workers=None,
+                 geo_layer="geo_layer.npz"):
+    """
+    Renders the figures into the output folder, one file for each format,
+    and saves the time taken by each figure to timings.json.
+    The geo figures share the layer persisted at geo_layer, see geo.load_geo_layer.
+    Returns the timings, a figure that failed has its error instead of files.
+    """
+    if figures is None:
+        figures = list(FIGURES)
+    for name in figures:
+        if name not in FIGURES:
+            raise ValueError(F"Unknown figure: {name}")
+    os.makedirs(output, exist_ok=True)
+
+    start = time.perf_counter()
+    df = load_dataframe(data)
+    timings = {"load": time.perf_counter() - start, "figures": {}}
+
+    layer = None
+    if any(FIGURES[name][2] is None for name in figures):
+        start_layer = time.perf_counter()
+        layer = importlib.import_module("geo").load_geo_layer(df, geo_layer)
+        timings["geo_layer"] = time.perf_counter() - start_layer
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_render_figure, name, _get_figure_input(name, df, layer),
+                                   output, formats): name
+                   for name in figures}
+        for future in as_completed(futures):
+            timings["figures"][futures[future]] = future.result()
+    timings["total"] = time.perf_counter() - start
+
+    with open(os.path.join(output, "timings.json"), "w", encoding="utf-8") as f:
+        json.dump(timings, f, indent=2)
+    return timings
+
+
+def _get_figure_input(name, df, layer):
+    """
+    Returns only the columns the figure needs, or the geo layer.
+    """
+    columns = FIGURES[name][2]
+    if columns is None:
+        return layer
+    return df[columns].copy()
+
+
+def _render_figure(name, inputs, output, formats):
+    """
+    Renders a single figure in a worker process.
+    """
+    module_name, function_name, _, prepare = FIGURES[name]
+    try:
+        start = time.perf_counter()
+        data = prepare(inputs) if prepare else inputs
+        prepared = time.perf_counter()
+
+        plot = getattr(importlib.import_module(module_name), function_name)
+        plot(data)
+        # The plot functions do not return their figures
+        fig = plt.gcf()
+        files = [os.path.join(output, F"{name}.{file_format}") for file_format in formats]
+        for file_path in files:
+            fig.savefig(file_path)
+        end = time.perf_counter()
+        return {"prepare": prepared - start, "render": end - prepared, "files": files}
+    except Exception:
+        return {"error": traceback.format_exc()}
+    finally:
+        plt.close("all")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', type=str, default='accidents',
+                        help='The dataframe file, see download.load_dataframe')
+    parser.add_argument('--output', type=str, default='report',
+                        help='Folder to save the figures to')
+    parser.add_argument('--formats', nargs='+', default=['png'], choices=['png', 'pdf'],
+                        help='Formats of the saved figures')
+    parser.add_argument('--figures', nargs='+', choices=list(FIGURES),
+                        help='Figures to render, all by default')
+    parser.add_argument('--workers', type=int,
+                        help='Number of worker processes, all CPUs by default')
+    parser.add_argument('--geo_layer', type=str, default='geo_layer.npz',
+                        help='The persisted geo layer, built if missing or outdated')
+    args = parser.parse_args()
+
+    timings = build_report(args.data, args.output, args.formats, args.figures, args.workers,
+                           args.geo_layer)
+    print(F"{'load':>18}: {timings['load']:.2f} s")
+    if "geo_layer" in timings:
+        print(F"{'geo layer':>18}: {timings['geo_layer']:.2f} s")
+    failed = False
+    for name in sorted(timings["figures"]):
+        timing = timings["figures"][name]
+        if "error" in timing:
+            failed = True
+            print(F"{name:>18}: failed\n{timing['error']}")
+        else:
+            print(F"{name:>18}: prepared in {timing['prepare']:.2f} s, "
+                  F"rendered in {timing['render']:.2f} s")
+    print(F"{'total':>18}: {timings['total']:.2f} s")
+    if failed:
+        raise SystemExit(1)